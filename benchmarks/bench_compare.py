@@ -0,0 +1,77 @@
+"""
+Benchmark the compare phase on two identical trees of many small files
+
+Creates the trees in a temporary directory (or under --data-dir, which
+should be on the disk to measure) and runs a full compare for each setting.
+Note: Unless the data directory is on a cold cache, the numbers mostly show
+the CPU overhead per file.
+
+Run from the repository top: python -m benchmarks.bench_compare
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from cmpdisktree import comparer
+
+
+def make_tree(top: Path, num_files, file_size, files_per_dir=1000):
+    """Create num_files files of file_size random bytes each under top"""
+    for i in range(num_files):
+        dirpath = top.joinpath(f"dir-{i // files_per_dir:05d}")
+        if i % files_per_dir == 0:
+            dirpath.mkdir(parents=True)
+        dirpath.joinpath(f"file-{i:07d}.bin").write_bytes(os.urandom(file_size))
+
+
+def copy_tree(src: Path, dest: Path):
+    for dirpath, _, filenames in os.walk(src):
+        destdir = dest.joinpath(Path(dirpath).relative_to(src))
+        destdir.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            destdir.joinpath(name).write_bytes(Path(dirpath, name).read_bytes())
+
+
+def run_compare(fs1, fs2, output_path, **kwargs):
+    cc = comparer.Comparer(
+        fs1, fs2, quiet=True, output_path=output_path, force_progress=False, **kwargs
+    )
+    start = time.perf_counter()
+    status = cc.work()
+    elapsed = time.perf_counter() - start
+    assert status == 0, "Trees should be identical"
+    return elapsed
+
+
+SETTINGS = [
+    {'small_file_size': 0},
+    {},
+    {'compare_workers': 4, 'small_file_size': 0},
+    {'compare_workers': 4},
+    {'compare_workers': 8},
+    {'pipeline': True, 'compare_workers': 4},
+]
+
+
+@click.command()
+@click.option('--num-files', default=20000, show_default=True)
+@click.option('--file-size', default=4096, show_default=True)
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+def main(num_files, file_size, data_dir):
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_tree(fs1, num_files, file_size)
+        copy_tree(fs1, fs2)
+        for settings in SETTINGS:
+            elapsed = run_compare(fs1, fs2, tmp, **settings)
+            rate = num_files / elapsed
+            name = str(settings or 'serial')
+            print(f"{name:45} {elapsed:8.3f}s {rate:10.0f} files/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark the traversal of a deep tree with paths vs directory file descriptors
+
+Creates a tree of the given depth (a chain of directories with some files
+and symlinks on each level, several chains side by side) and runs a
+traversal-only compare with and without --dir-fds.
+
+Run from the repository top: python -m benchmarks.bench_dir_fds
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import click
+
+from benchmarks.bench_compare import run_compare
+
+REPEATS = 3
+
+
+def make_deep_tree(top: Path, depth, num_chains, entries_per_level):
+    for chain in range(num_chains):
+        dirpath = top.joinpath(f"chain-{chain:03d}")
+        for level in range(depth):
+            dirpath = dirpath.joinpath(f"level-{level:02d}")
+            dirpath.mkdir(parents=True)
+            for i in range(entries_per_level):
+                dirpath.joinpath(f"file-{i:03d}.txt").write_text(str(i))
+            dirpath.joinpath('link').symlink_to('file-000.txt')
+
+
+def copy_deep_tree(src: Path, dest: Path):
+    for dirpath, dirnames, filenames in os.walk(src):
+        destdir = dest.joinpath(Path(dirpath).relative_to(src))
+        destdir.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            srcpath = Path(dirpath, name)
+            if srcpath.is_symlink():
+                destdir.joinpath(name).symlink_to(os.readlink(srcpath))
+            else:
+                destdir.joinpath(name).write_bytes(srcpath.read_bytes())
+
+
+@click.command()
+@click.option('--depth', default=25, show_default=True)
+@click.option('--num-chains', default=100, show_default=True)
+@click.option('--entries-per-level', default=10, show_default=True)
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+def main(depth, num_chains, entries_per_level, data_dir):
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_deep_tree(fs1, depth, num_chains, entries_per_level)
+        copy_deep_tree(fs1, fs2)
+        num_entries = num_chains * depth * (entries_per_level + 2)
+        for settings in [{}, {'dir_fds': True}]:
+            elapsed = min(
+                run_compare(fs1, fs2, tmp, traversal_only=True, **settings)
+                for _ in range(REPEATS)
+            )
+            name = str(settings or 'paths')
+            print(
+                f"{name:20} {elapsed:8.3f}s {num_entries / elapsed:10.0f} entries/s"
+            )
+
+
+if __name__ == '__main__':
+    main()
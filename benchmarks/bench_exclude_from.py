@@ -0,0 +1,78 @@
+"""
+Benchmark of exclude-from files with growing numbers of rules
+
+Writes rule files with 10, 1k and 10k rules (a mix of literal names, anchored
+and unanchored globs and some include rules), reads and compiles each and
+measures the exclusion check per path. For comparison the fnmatch loop over
+all rules (first match wins) is timed on a sample of the paths.
+
+Run from the repository top: python -m benchmarks.bench_exclude_from
+"""
+import fnmatch
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from cmpdisktree import exclusions
+
+from benchmarks.bench_exclusions import make_paths, per_path_cost
+
+RULE_COUNTS = [10, 1000, 10000]
+# The fnmatch loop is too slow for all paths with 10k rules
+NUM_LOOP_PATHS = 500
+
+
+def make_rule_lines(num_rules):
+    rnd = random.Random(num_rules)
+    lines = ['# generated rules']
+    for i in range(num_rules):
+        kind = rnd.randrange(5)
+        if kind == 0:
+            lines.append(f'- name{i}.bak')
+        elif kind == 1:
+            lines.append(f'/Users/someone/project{i}/*')
+        elif kind == 2:
+            lines.append(f'- cache{i}*.tmp')
+        elif kind == 3:
+            lines.append(f'- Library/Application Support/app{i}/*')
+        else:
+            lines.append(f'+ keep{i}*')
+    return lines
+
+
+def fnmatch_loop(rules, pathstr):
+    """Check the rules one by one (first match wins)"""
+    for rule in rules:
+        pat = rule.pattern
+        match_pat = pat if pat.startswith('/') else '*/' + pat
+        if fnmatch.fnmatch(pathstr, match_pat):
+            return None if rule.include else pat
+    return None
+
+
+def main():
+    paths = make_paths()
+    with tempfile.TemporaryDirectory(prefix='cmpdisktree-bench-') as tmp:
+        for num_rules in RULE_COUNTS:
+            fpath = Path(tmp).joinpath(f'rules-{num_rules}.txt')
+            fpath.write_text('\n'.join(make_rule_lines(num_rules)) + '\n')
+
+            start = time.perf_counter()
+            rules = exclusions.read_filter_file(fpath)
+            matcher = exclusions.ExclusionMatcher([], filter_rules=rules)
+            compile_ms = (time.perf_counter() - start) * 1e3
+
+            matcher_cost = per_path_cost(matcher.match, paths)
+            loop_cost = per_path_cost(
+                lambda p: fnmatch_loop(rules, p), paths[:NUM_LOOP_PATHS]
+            )
+            print(
+                f"{num_rules:6} rules: read+compile {compile_ms:7.1f} ms, "
+                f"ExclusionMatcher {matcher_cost:6.2f} µs per path, "
+                f"fnmatch loop {loop_cost:9.2f} µs per path"
+            )
+
+
+if __name__ == '__main__':
+    main()
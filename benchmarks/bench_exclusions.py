@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the exclusion check per path
+
+Compares the fnmatch loop over all patterns (as done up to version 0.2) with
+the compiled ExclusionMatcher, for the standard plus the live FS exclusions.
+
+Run from the repository top: python -m benchmarks.bench_exclusions
+"""
+import fnmatch
+import random
+import time
+
+from cmpdisktree import exclusions
+
+PATTERNS = exclusions.STANDARD_EXCLUDE_PATTERNS + exclusions.ADD_LIVEFS_EXCLUDE_PATTERNS
+COMPONENTS = [
+    'Users', 'someone', 'Library', 'Application Support', 'Documents', 'src',
+    'project', 'node_modules', 'lib', 'index.js', 'photo.jpg', 'notes.txt',
+    'Caches', '.DS_Store', 'private', 'var', 'db', '._resource',
+]
+NUM_PATHS = 20000
+
+
+def fnmatch_loop(pathstr, relative_fs_top=False):
+    """The exclusion check as done by Comparer.excluded up to version 0.2"""
+    for pat in PATTERNS:
+        front_only = False
+        if pat.startswith('/'):
+            pat = pat[1:]
+            if not relative_fs_top:
+                front_only = True
+        match_pat = '/' + pat if front_only else '*/' + pat
+        if fnmatch.fnmatch(pathstr, match_pat):
+            return pat
+    return None
+
+
+def make_paths():
+    rnd = random.Random(42)
+    return [
+        '/' + '/'.join(rnd.choice(COMPONENTS) for _ in range(rnd.randint(1, 8)))
+        for _ in range(NUM_PATHS)
+    ]
+
+
+def per_path_cost(func, paths):
+    start = time.perf_counter()
+    for pathstr in paths:
+        func(pathstr)
+    return (time.perf_counter() - start) / len(paths) * 1e6
+
+
+def main():
+    paths = make_paths()
+    matcher = exclusions.ExclusionMatcher(PATTERNS)
+    excluded = sum(matcher.match(p) is not None for p in paths)
+    print(f"{len(PATTERNS)} patterns, {len(paths)} paths ({excluded} excluded)")
+    funcs = {'fnmatch loop': fnmatch_loop, 'ExclusionMatcher': matcher.match}
+    for name, func in funcs.items():
+        print(f"{name:20} {per_path_cost(func, paths):8.2f} µs per path")
+
+
+if __name__ == '__main__':
+    main()
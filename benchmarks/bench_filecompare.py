@@ -0,0 +1,77 @@
+"""
+Benchmark the file content comparison against filecmp.cmp
+
+Compares two identical files per size bucket (from the page cache unless the
+data directory is on a cold cache) and reports the throughput.
+
+Run from the repository top: python -m benchmarks.bench_filecompare
+"""
+import filecmp
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from cmpdisktree import filecompare
+
+SIZE_BUCKETS = [4 * 1024, 256 * 1024, 16 * filecompare.MIB, 256 * filecompare.MIB]
+# Read roughly this many bytes per bucket (repeating the compare)
+BYTES_PER_BUCKET = 512 * filecompare.MIB
+
+
+def write_random_file(path: Path, size):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(remaining, filecompare.MIB))
+            f.write(block)
+            remaining -= len(block)
+
+
+def engines():
+    """The compare functions to benchmark: name -> func(path1, path2)"""
+    content_comparer = filecompare.ContentComparer()
+    mmap_comparer = filecompare.ContentComparer(engine=filecompare.MMAP_ENGINE)
+    direct_comparer = filecompare.ContentComparer(engine=filecompare.DIRECT_ENGINE)
+    return {
+        'filecmp': lambda p1, p2: filecmp.cmp(p1, p2, shallow=False),
+        'readinto': content_comparer.cmp,
+        'mmap': mmap_comparer.cmp,
+        # Always from the disk (the others from the page cache)
+        'direct': direct_comparer.cmp,
+    }
+
+
+def throughput(func, path1, path2, size):
+    repeat = max(1, BYTES_PER_BUCKET // size)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        filecmp.clear_cache()
+        assert func(path1, path2)
+    elapsed = time.perf_counter() - start
+    return repeat * size / elapsed / filecompare.MIB
+
+
+@click.command()
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+def main(data_dir):
+    compare_funcs = engines()
+    print(f"{'size':>12} " + " ".join(f"{name:>12}" for name in compare_funcs))
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        for size in SIZE_BUCKETS:
+            path1 = Path(tmp, f'{size}-1')
+            path2 = Path(tmp, f'{size}-2')
+            write_random_file(path1, size)
+            path2.write_bytes(path1.read_bytes())
+            rates = [
+                throughput(func, path1, path2, size) for func in compare_funcs.values()
+            ]
+            print(f"{size:>12} " + " ".join(f"{r:8.0f}MiB/s" for r in rates))
+            path1.unlink()
+            path2.unlink()
+
+
+if __name__ == '__main__':
+    main()
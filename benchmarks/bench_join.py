@@ -0,0 +1,62 @@
+"""
+Benchmark the matching of FS1/FS2 directory listings (scanner.join_entries)
+
+Uses synthetic in-memory entries, 1% of them missing on each side.
+The old list based matching of cmp_list is quadratic and is only run for the
+smallest size.
+
+Run from the repository top: python -m benchmarks.bench_join
+"""
+import time
+from types import SimpleNamespace
+
+from cmpdisktree import scanner
+
+SIZES = [10_000, 100_000, 1_000_000]
+OLD_ALGO_MAX_SIZE = 10_000
+
+
+def make_entries(size):
+    entries1 = [SimpleNamespace(name=f"entry-{i:07d}") for i in range(size)]
+    entries2 = [e for i, e in enumerate(entries1) if i % 100 != 0]
+    entries2 += [SimpleNamespace(name=f"extra-{i:07d}") for i in range(size // 100)]
+    return entries1, entries2
+
+
+def old_list_matching(names1, names2):
+    """The matching as done by cmp_list up to version 0.2"""
+    loop_list = names1.copy()
+    reduce_list2 = names2.copy()
+    both = []
+    only1 = []
+    for e in loop_list:
+        if e in reduce_list2:
+            both.append(e)
+            reduce_list2.remove(e)
+        else:
+            only1.append(e)
+    return only1, reduce_list2, both
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'entries':>10} {'join_entries':>14} {'old matching':>14}")
+    for size in SIZES:
+        entries1, entries2 = make_entries(size)
+        new_time = timed(scanner.join_entries, entries1, entries2)
+        if size <= OLD_ALGO_MAX_SIZE:
+            names1 = [e.name for e in entries1]
+            names2 = [e.name for e in entries2]
+            old_text = f"{timed(old_list_matching, names1, names2):13.3f}s"
+        else:
+            old_text = f"{'(skipped)':>14}"
+        print(f"{size:>10} {new_time:13.3f}s {old_text}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure the peak memory per queued file of the files to compare
+
+Fills a plain list of CompareItems (the representation up to version 0.2,
+roughly) and a CompareStore with the same synthetic entries and reports the
+peak memory traced by tracemalloc.
+
+Run from the repository top: python -m benchmarks.bench_memory
+"""
+import stat
+import tracemalloc
+from pathlib import Path
+
+import click
+
+from cmpdisktree.comparestore import CompareStore
+from cmpdisktree.filecompare import CompareItem
+
+FS1 = Path('/Volumes/Macintosh HD')
+FS2 = Path('/Volumes/Backup of Macintosh HD')
+
+
+def make_items(num_files, files_per_dir):
+    """Synthetic CompareItems (generated lazily, not counted themselves)"""
+    for i in range(num_files):
+        rel = Path('Users/someone/Library/Application Support/dir-{:06d}'.format(
+            i // files_per_dir), f'some-file-name-{i:08d}.dat')
+        sig1 = (stat.S_IFREG, 1000 + i, 1.6e9 + i)
+        sig2 = (stat.S_IFREG, 1000 + i, 1.6e9 + i)
+        yield CompareItem(FS1 / rel, FS2 / rel, sig1, sig2)
+
+
+def peak_bytes(container, num_files, files_per_dir):
+    tracemalloc.start()
+    store = container()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for item in make_items(num_files, files_per_dir):
+        store.append(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline
+
+
+@click.command()
+@click.option('--num-files', default=200000, show_default=True)
+@click.option('--files-per-dir', default=50, show_default=True)
+def main(num_files, files_per_dir):
+    containers = {
+        'list of CompareItems': list,
+        'CompareStore': lambda: CompareStore(FS1, FS2),
+    }
+    for name, container in containers.items():
+        peak = peak_bytes(container, num_files, files_per_dir)
+        print(f"{name:22} {peak / num_files:8.1f} bytes per queued file (peak)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark the page cache growth of the compare phase per cache policy
+
+Creates two identical trees of larger files, evicts them from the page cache
+and runs a compare for each --cache-policy. Reports by how much the page
+cache (`Cached:` in /proc/meminfo, so Linux only) grew during the compare.
+Other activity on the host shows up in the numbers as well.
+
+Run from the repository top: python -m benchmarks.bench_page_cache
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import click
+
+from cmpdisktree import filecompare
+
+from benchmarks.bench_compare import copy_tree, make_tree, run_compare
+
+MIB = filecompare.MIB
+
+
+def cached_mib():
+    """The size of the page cache in MiB"""
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('Cached:'):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("No 'Cached:' in /proc/meminfo")
+
+
+def evict_tree(top: Path):
+    """Drop the (written back) files under top from the page cache"""
+    os.sync()
+    for dirpath, _, filenames in os.walk(top):
+        for name in filenames:
+            fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+@click.command()
+@click.option('--num-files', default=100, show_default=True)
+@click.option('--file-mib', default=8, show_default=True)
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+def main(num_files, file_mib, data_dir):
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_tree(fs1, num_files, file_mib * MIB, files_per_dir=50)
+        copy_tree(fs1, fs2)
+        total_mib = 2 * num_files * file_mib
+        print(f"Comparing {total_mib} MiB")
+        for cache_policy in filecompare.CACHE_POLICIES:
+            evict_tree(fs1)
+            evict_tree(fs2)
+            before = cached_mib()
+            elapsed = run_compare(fs1, fs2, tmp, cache_policy=cache_policy)
+            growth = cached_mib() - before
+            print(
+                f"{cache_policy:6} {elapsed:8.3f}s "
+                f"page cache growth {growth:8.1f} MiB"
+            )
+
+
+if __name__ == '__main__':
+    main()
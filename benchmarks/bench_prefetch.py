@@ -0,0 +1,47 @@
+"""
+Benchmark the compare phase of many small files with and without prefetch
+
+Creates two identical trees, evicts them from the page cache before each run
+(so every file has to come from the disk) and compares them with several
+--prefetch depths. Use --data-dir to measure on the disk (or the network
+mount) of interest; Linux only (posix_fadvise for the eviction).
+
+Run from the repository top: python -m benchmarks.bench_prefetch
+"""
+import tempfile
+from pathlib import Path
+
+import click
+
+from benchmarks.bench_compare import copy_tree, make_tree, run_compare
+from benchmarks.bench_page_cache import evict_tree
+
+SETTINGS = [
+    {},
+    {'prefetch': 8},
+    {'prefetch': 32},
+    {'compare_workers': 4},
+    {'compare_workers': 4, 'prefetch': 32},
+]
+
+
+@click.command()
+@click.option('--num-files', default=5000, show_default=True)
+@click.option('--file-size', default=16384, show_default=True)
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+def main(num_files, file_size, data_dir):
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_tree(fs1, num_files, file_size)
+        copy_tree(fs1, fs2)
+        for settings in SETTINGS:
+            evict_tree(fs1)
+            evict_tree(fs2)
+            elapsed = run_compare(fs1, fs2, tmp, **settings)
+            name = str(settings or 'no prefetch')
+            print(f"{name:40} {elapsed:8.3f}s {num_files / elapsed:10.0f} files/s")
+
+
+if __name__ == '__main__':
+    main()
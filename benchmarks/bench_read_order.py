@@ -0,0 +1,107 @@
+"""
+Benchmark the read orders of the compare phase by their seek distance
+
+Creates the files of the trees in random order, so that their name order (in
+which the traversal finds them) differs from their place on the disk. Then
+runs a compare for each --read-order, records the order in which the FS2
+files are read and sums up the distance between the end of one file and the
+start of the next one (by the physical offsets of their first extents), which
+is what a disk head would have to travel.
+
+The offsets need FIEMAP, so the data directory should be on ext4 (or another
+filesystem supporting it). To measure on an ext4 image in a loopback device:
+
+    truncate -s 2G /tmp/ext4.img && mkfs.ext4 -q /tmp/ext4.img
+    mkdir -p /mnt/bench && mount -o loop /tmp/ext4.img /mnt/bench
+    python -m benchmarks.bench_read_order --data-dir /mnt/bench --drop-caches
+
+Run from the repository top: python -m benchmarks.bench_read_order
+"""
+import os
+import random
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import click
+
+from cmpdisktree import filecompare, readorder
+
+from benchmarks.bench_compare import run_compare
+
+MIB = 1024 * 1024
+
+
+def make_shuffled_trees(fs1: Path, fs2: Path, num_files, file_size, files_per_dir):
+    """Create the same files in fs1 and fs2, in random order"""
+    rel_paths = [
+        Path(f"dir-{i // files_per_dir:04d}", f"file-{i:06d}.bin")
+        for i in range(num_files)
+    ]
+    random.Random(0).shuffle(rel_paths)
+    for rel_path in rel_paths:
+        content = os.urandom(file_size)
+        for top in (fs1, fs2):
+            top.joinpath(rel_path.parent).mkdir(parents=True, exist_ok=True)
+            top.joinpath(rel_path).write_bytes(content)
+    os.sync()
+
+
+def drop_caches():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def seek_distance(paths):
+    """Sum of the distances between the end of a file and the start of the next"""
+    distance = 0
+    backward = 0
+    position = None
+    for path in paths:
+        offset = readorder.physical_offset(path)
+        if offset is None:
+            continue
+        if position is not None:
+            distance += abs(offset - position)
+            backward += offset < position
+        position = offset + os.path.getsize(path)
+    return distance, backward
+
+
+@click.command()
+@click.option('--num-files', default=5000, show_default=True)
+@click.option('--file-size', default=16384, show_default=True)
+@click.option('--files-per-dir', default=100, show_default=True)
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+@click.option('--drop-caches', 'drop', is_flag=True, help="Needs root (Linux)")
+def main(num_files, file_size, files_per_dir, data_dir, drop):
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_shuffled_trees(fs1, fs2, num_files, file_size, files_per_dir)
+        if readorder.physical_offset(next(fs2.glob('*/*'))) is None:
+            print("Physical offsets not available here: seek distances are 0")
+
+        orig_cmp = filecompare.ContentComparer.cmp
+        for read_order in readorder.READ_ORDERS:
+            read_paths = []
+
+            def cmp(self, path1, path2, *args, **kwargs):
+                read_paths.append(path2)
+                return orig_cmp(self, path1, path2, *args, **kwargs)
+
+            if drop:
+                drop_caches()
+            with mock.patch.object(filecompare.ContentComparer, 'cmp', cmp):
+                elapsed = run_compare(fs1, fs2, tmp, read_order=read_order)
+            distance, backward = seek_distance(read_paths)
+            print(
+                f"{read_order:10} {elapsed:8.3f}s "
+                f"seek distance {distance / MIB:10.1f} MiB, "
+                f"{backward:6} backward seeks"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark the content comparison of sparse files with and without hole detection
+
+Creates two identical sparse files (a large logical size with a few data
+blocks spread over it) and compares them reading everything and by their
+data regions (SEEK_DATA/SEEK_HOLE). The holes read back as zeros without any
+disk I/O, so the difference is mostly the memory bandwidth for the zeros.
+
+Run from the repository top: python -m benchmarks.bench_sparse
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from cmpdisktree import filecompare
+
+MIB = filecompare.MIB
+
+
+def write_sparse_file(path: Path, logical_mib, block, num_blocks):
+    step = logical_mib * MIB // num_blocks
+    with open(path, 'wb') as f:
+        f.truncate(logical_mib * MIB)
+        for i in range(num_blocks):
+            f.seek(i * step)
+            f.write(block)
+
+
+@click.command()
+@click.option('--logical-mib', default=16384, show_default=True)
+@click.option('--data-mib', default=256, show_default=True)
+@click.option('--num-blocks', default=64, show_default=True)
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None)
+def main(logical_mib, data_mib, num_blocks, data_dir):
+    if not filecompare.SPARSE_SUPPORTED:
+        print("SEEK_DATA/SEEK_HOLE not supported here")
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        path1 = Path(tmp, 'sparse-1')
+        path2 = Path(tmp, 'sparse-2')
+        block = os.urandom(data_mib * MIB // num_blocks)
+        write_sparse_file(path1, logical_mib, block, num_blocks)
+        write_sparse_file(path2, logical_mib, block, num_blocks)
+        physical = path1.stat().st_blocks * 512 / MIB
+        print(f"{logical_mib} MiB logical, {physical:.0f} MiB physical per file")
+        for sparse in [False, True]:
+            comparer = filecompare.ContentComparer(sparse=sparse)
+            start = time.perf_counter()
+            assert comparer.cmp(path1, path2)
+            elapsed = time.perf_counter() - start
+            name = 'data regions' if sparse else 'read all'
+            print(f"{name:15} {elapsed:8.3f}s {logical_mib / elapsed:10.0f} MiB/s")
+
+
+if __name__ == '__main__':
+    main()
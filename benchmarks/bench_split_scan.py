@@ -0,0 +1,61 @@
+"""
+Benchmark the traversal with FS1 and FS2 listed in lockstep vs separate scanners
+
+Simulates two devices with different latencies: every directory listing of
+FS1 is delayed by --latency1 and every listing of FS2 by --latency2 (in ms).
+In lockstep the latencies add up per directory, with --split-scan the slower
+device sets the pace.
+
+Run from the repository top: python -m benchmarks.bench_split_scan
+"""
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import click
+
+from cmpdisktree import scanner
+
+from benchmarks.bench_compare import copy_tree, make_tree, run_compare
+
+SETTINGS = [
+    {},
+    {'split_scan': True},
+    {'traverse_workers': 4},
+    {'traverse_workers': 4, 'split_scan': True},
+]
+
+
+def delayed_scan_dir(fs1: Path, latency1, latency2):
+    """scanner.scan_dir with a delay depending on the filesystem"""
+    orig_scan_dir = scanner.scan_dir
+
+    def scan_dir(path, onerror=None):
+        in_fs1 = str(path).startswith(str(fs1))
+        time.sleep(latency1 if in_fs1 else latency2)
+        return orig_scan_dir(path, onerror)
+
+    return scan_dir
+
+
+@click.command()
+@click.option('--num-dirs', default=300, show_default=True)
+@click.option('--latency1', default=1.0, show_default=True)
+@click.option('--latency2', default=3.0, show_default=True)
+def main(num_dirs, latency1, latency2):
+    with tempfile.TemporaryDirectory() as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_tree(fs1, num_dirs * 10, 16, files_per_dir=10)
+        copy_tree(fs1, fs2)
+        scan_dir = delayed_scan_dir(fs1, latency1 / 1000, latency2 / 1000)
+        with mock.patch.object(scanner, 'scan_dir', scan_dir):
+            for settings in SETTINGS:
+                elapsed = run_compare(fs1, fs2, tmp, traversal_only=True, **settings)
+                name = str(settings or 'lockstep')
+                print(f"{name:45} {elapsed:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
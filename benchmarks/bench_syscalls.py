@@ -0,0 +1,150 @@
+"""
+Count the metadata system calls per file of the traversal and compare phases
+
+The calls are counted at the Python level by wrapping the os functions (and
+the os.DirEntry objects handed out by os.scandir). DirEntry calls are counted
+as CPython does them on Linux/macOS: is_dir()/is_file()/is_symlink() are free
+thanks to d_type (except when following a symlink), stat() costs one call on
+first use.
+
+Run from the repository top: python -m benchmarks.bench_syscalls
+"""
+import builtins
+import collections
+import contextlib
+import os
+import tempfile
+from pathlib import Path
+
+import click
+
+from benchmarks.bench_compare import copy_tree, make_tree
+from cmpdisktree import comparer, filecompare
+
+
+class CountingDirEntry:
+    """Wraps an os.DirEntry and counts the system calls it would do"""
+
+    def __init__(self, entry, counter):
+        self.entry = entry
+        self.counter = counter
+        self.name = entry.name
+        self.path = entry.path
+        self.stat_cached = set()
+
+    def __fspath__(self):
+        return self.path
+
+    def inode(self):
+        return self.entry.inode()
+
+    def is_symlink(self):
+        return self.entry.is_symlink()
+
+    def is_dir(self, *, follow_symlinks=True):
+        if follow_symlinks and self.entry.is_symlink():
+            self.count_stat(True)
+        return self.entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, *, follow_symlinks=True):
+        if follow_symlinks and self.entry.is_symlink():
+            self.count_stat(True)
+        return self.entry.is_file(follow_symlinks=follow_symlinks)
+
+    def stat(self, *, follow_symlinks=True):
+        self.count_stat(follow_symlinks)
+        return self.entry.stat(follow_symlinks=follow_symlinks)
+
+    def count_stat(self, follow_symlinks):
+        if follow_symlinks not in self.stat_cached:
+            self.stat_cached.add(follow_symlinks)
+            self.counter['stat' if follow_symlinks else 'lstat'] += 1
+
+
+@contextlib.contextmanager
+def counting_syscalls(counter):
+    """Count the calls of stat, lstat, readlink, open and scandir in counter"""
+    orig_stat = os.stat
+    orig_lstat = os.lstat
+    orig_readlink = os.readlink
+    orig_scandir = os.scandir
+    orig_open = builtins.open
+
+    def counting_stat(path, *args, follow_symlinks=True, **kwargs):
+        counter['stat' if follow_symlinks else 'lstat'] += 1
+        return orig_stat(path, *args, follow_symlinks=follow_symlinks, **kwargs)
+
+    def counting_lstat(path, *args, **kwargs):
+        counter['lstat'] += 1
+        return orig_lstat(path, *args, **kwargs)
+
+    def counting_readlink(path, *args, **kwargs):
+        counter['readlink'] += 1
+        return orig_readlink(path, *args, **kwargs)
+
+    @contextlib.contextmanager
+    def counting_scandir(path='.'):
+        counter['scandir'] += 1
+        with orig_scandir(path) as it:
+            yield (CountingDirEntry(entry, counter) for entry in it)
+
+    def counting_open(*args, **kwargs):
+        counter['open'] += 1
+        return orig_open(*args, **kwargs)
+
+    os.stat, os.lstat, os.readlink = counting_stat, counting_lstat, counting_readlink
+    os.scandir = counting_scandir
+    filecompare.open = counting_open
+    try:
+        yield counter
+    finally:
+        os.stat, os.lstat, os.readlink = orig_stat, orig_lstat, orig_readlink
+        os.scandir = orig_scandir
+        del filecompare.open
+
+
+def print_counts(title, counter, num_files):
+    calls = ", ".join(
+        f"{name} {count / num_files:.2f}" for name, count in sorted(counter.items())
+    )
+    print(f"{title:10} per file: {calls}")
+
+
+@click.command()
+@click.option('--num-files', default=10000, show_default=True)
+@click.option('--traverse-from-list', is_flag=True, help="Use a traversal list")
+def main(num_files, traverse_from_list):
+    with tempfile.TemporaryDirectory() as tmp:
+        fs1 = Path(tmp, 'fs1')
+        fs2 = Path(tmp, 'fs2')
+        make_tree(fs1, num_files, 1024)
+        copy_tree(fs1, fs2)
+        travlist = None
+        if traverse_from_list:
+            travlist = Path(tmp, 'travlist.txt')
+            travlist.write_text(
+                "".join(f"{Path(d, f).relative_to(fs1)}\n"
+                        for d, _, files in os.walk(fs1) for f in files)
+            )
+
+        cc = comparer.Comparer(
+            fs1, fs2, quiet=True, output_path=tmp, force_progress=False,
+            traverse_from_list=travlist,
+        )
+        phase1 = collections.Counter()
+        with counting_syscalls(phase1):
+            if travlist is None:
+                cc.work_phase1_traverse()
+            else:
+                cc.work_phase1_from_list(travlist)
+        phase2 = collections.Counter()
+        with counting_syscalls(phase2):
+            cc.work_phase2_compare()
+        assert cc.everything_ok, "Trees should be identical"
+
+        print_counts('Phase 1', phase1, num_files)
+        print_counts('Phase 2', phase2, num_files)
+
+
+if __name__ == '__main__':
+    main()
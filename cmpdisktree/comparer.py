@@ -1,21 +1,144 @@
 #!/usr/bin/env python3
 
 import errno
-import filecmp
-import fnmatch
+import functools
+import json
 import logging
 import os
 import pprint as pp
+import queue
+import stat
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from logging import DEBUG, ERROR, INFO
 from pathlib import Path
 
 import click
 
-from cmpdisktree import debug, exclusions, utils
+from cmpdisktree import (
+    comparestore,
+    debug,
+    devices,
+    exclusions,
+    filecompare,
+    prefetch,
+    readorder,
+    scanner,
+    utils,
+)
+from cmpdisktree.filecompare import MIB
 from cmpdisktree.utils import Display, ErrorKind, FileKind, OpMode
 
 
+# Number of directory listings kept in flight per traversal worker thread
+PREFETCH_PER_WORKER = 4
+# Maximal number of paths waiting for the compare thread in pipelined mode
+PIPELINE_QUEUE_SIZE = 10000
+# Maximal number of small files a compare thread takes at once
+COMPARE_BATCH_SIZE = 64
+
+
+class DirFds:
+    """
+    The open file descriptors of a directory in FS1 and FS2
+
+    Closed once neither the directory itself nor one of its subdirectories
+    still to be listed (which are opened relative to them) needs them.
+    """
+
+    __slots__ = ('fd1', 'fd2', 'users')
+
+    def __init__(self):
+        self.fd1 = None
+        self.fd2 = None
+        self.users = 1
+
+    def acquire(self):
+        self.users += 1
+
+    def release(self):
+        self.users -= 1
+        if self.users == 0:
+            for fd in (self.fd1, self.fd2):
+                if fd is not None:
+                    os.close(fd)
+            self.fd1 = self.fd2 = None
+
+
+class DirNode:
+    """A directory of FS1 (and its counterpart in FS2) waiting for traversal"""
+
+    __slots__ = (
+        'path1',
+        'path2',
+        'rel_prefix',
+        'rel_dir',
+        'anchored',
+        'listing',
+        'parent_fds',
+        'fds',
+    )
+
+    def __init__(
+        self,
+        path1: Path,
+        path2: Path,
+        rel_prefix: str,
+        anchored: bool,
+        parent_fds: DirFds = None,
+        open_fds: bool = False,
+    ):
+        """
+        :param path1: The directory in FS1
+        :param path2: The directory in FS2
+        :param rel_prefix: Prefix of its entries for the exclusion matching:
+                           '/' for the FS top, '/REL/PATH/' below
+        :param anchored: Whether exclusion patterns anchored at the FS top can
+                         match below it (inherited by the subdirectories)
+        :param parent_fds: The DirFds of the parent directory (if traversing with
+                           directory file descriptors), released by release_fds()
+        :param open_fds: Whether the listing opens the directories (see DirFds)
+        """
+        self.path1 = path1
+        self.path2 = path2
+        self.rel_prefix = rel_prefix
+        # Relative path as used by the CompareStore
+        self.rel_dir = rel_prefix[1:-1] or '.'
+        self.anchored = anchored
+        # Future of its listing (if prefetched by a worker thread)
+        self.listing = None
+        self.parent_fds = parent_fds
+        # Its own DirFds (the descriptors are set by the listing)
+        self.fds = DirFds() if open_fds else None
+
+    @property
+    def dir_fd1(self):
+        """dir_fd argument for the os functions on its entries in FS1"""
+        return None if self.fds is None else self.fds.fd1
+
+    @property
+    def dir_fd2(self):
+        """dir_fd argument for the os functions on its entries in FS2"""
+        return None if self.fds is None else self.fds.fd2
+
+    def entry_path1(self, name: str):
+        """Path argument (relative to dir_fd1) for the os functions in FS1"""
+        return name if self.fds is not None else os.path.join(self.path1, name)
+
+    def entry_path2(self, name: str):
+        """Path argument (relative to dir_fd2) for the os functions in FS2"""
+        return name if self.fds is not None else os.path.join(self.path2, name)
+
+    def release_fds(self):
+        """Done with the directory: Release its own and its parent's DirFds"""
+        for fds in (self.parent_fds, self.fds):
+            if fds is not None:
+                fds.release()
+        self.parent_fds = self.fds = None
+
+
 #
 # Main Class
 #
@@ -34,9 +157,27 @@ class Comparer:
         shallow_compare=False,
         clear_std_exclusions=False,
         live_fs_exclusions=False,
+        exclude_from=(),
         ignore_missing_in_fs1=False,
         relative_fs_top=False,
         output_path=None,
+        traverse_workers=1,
+        pipeline=False,
+        compare_workers=1,
+        compare_chunk_size=4,
+        spill_threshold=None,
+        exclusion_report=None,
+        dir_fds=False,
+        split_scan=False,
+        fs1_device_workers=None,
+        fs2_device_workers=None,
+        read_order=readorder.DISCOVERY,
+        large_file_size=None,
+        range_workers=filecompare.DEFAULT_RANGE_WORKERS,
+        compare_engine=filecompare.READINTO_ENGINE,
+        cache_policy=filecompare.CACHE_KEEP,
+        prefetch=0,
+        small_file_size=filecompare.DEFAULT_SMALL_FILE_SIZE // 1024,
         # hidden options - not in help or doco:
         force_progress=None,
     ):
@@ -49,11 +190,40 @@ class Comparer:
         :param report_identical: Create cmp-ok.log
         :param traversal_only: Do only phase 1 (traversal)
         :param traverse_from_list: Use file with  list of paths for traversal
-        :param shallow_compare: Passed to filecmp
+        :param shallow_compare: Take files with same size and mtime as equal
         :param clear_std_exclusions: No exclusions
         :param live_fs_exclusions: Add exclusions for live FS
+        :param exclude_from: Files with filter rules (applied before the exclusions)
         :param relative_fs_top: Top doesn't need tio be a macOS disk top
         :param output_path: Output path for report file
+        :param traverse_workers: Number of threads listing directories in phase 1
+        :param pipeline: Compare file contents while still traversing
+        :param compare_workers: Number of threads comparing file contents in phase 2
+        :param compare_chunk_size: Maximal size (in MiB) of the reads when comparing
+        :param spill_threshold: Memory (in MiB) for the files to compare above which
+                                they are moved to a temporary file (None: never)
+        :param exclusion_report: Write per-pattern exclusion statistics
+                                 ('text' or 'json', None: no statistics)
+        :param dir_fds: Keep the directories open in the traversal and access
+                        their entries relative to them
+        :param split_scan: List FS1 and FS2 with separate threads
+        :param fs1_device_workers: Maximal number of reads in flight on the device
+                                   of FS1 (None: compare_workers)
+        :param fs2_device_workers: The same for FS2. If one of them is set, the
+                                   reads are scheduled per device
+        :param read_order: Order of the files in the compare phase: as found by
+                           the traversal ('discovery'), by inode number
+                           ('inode') or by physical offset ('extent') in FS2
+        :param large_file_size: Size (in MiB) from which a file is compared in
+                                byte ranges at the same time (None: never)
+        :param range_workers: Number of threads comparing the byte ranges
+        :param compare_engine: How the file contents are compared: read into
+                               buffers ('readinto') or memory-mapped ('mmap')
+        :param cache_policy: 'keep': leave the page cache to the OS, 'drop': drop
+                             the compared file contents from the page cache
+        :param prefetch: Number of files to read ahead in the compare phase
+        :param small_file_size: Size (in KiB) up to which files are read in one
+                                go and handed to the compare threads in batches
         :param force_progress: True: show for sure progress bar
                                False: show for sure NO progress bar
                                None: let tqdm handle it (depends on tty)
@@ -83,27 +253,74 @@ class Comparer:
         self.traverse_from_list = traverse_from_list
         self.clear_std_exclusions = clear_std_exclusions
         self.live_fs_exclusions = live_fs_exclusions
+        self.exclude_from = exclude_from
         self.ignore_missing_in_fs1 = ignore_missing_in_fs1
         self.relative_fs_top = relative_fs_top
         self.output_path = output_path
+        self.traverse_workers = traverse_workers
+        self.pipeline = pipeline
+        self.compare_workers = compare_workers
+        self.exclusion_report = exclusion_report
+        self.split_scan = split_scan
+        self.read_order = read_order
+        self.prefetch = prefetch
+        if pipeline and read_order != readorder.DISCOVERY:
+            self.echo(DEBUG, "Pipelined compare: files are read in discovery order")
+        if pipeline and prefetch:
+            self.echo(DEBUG, "Pipelined compare: no prefetch of upcoming files")
+        self.dir_fds = dir_fds and scanner.DIR_FDS_SUPPORTED
+        if dir_fds and not self.dir_fds:
+            self.echo(DEBUG, "Directory file descriptors not supported: using paths")
 
         # Initialisations
         # List of folders not to traverse:
         if self.clear_std_exclusions:
-            self.exclude_patterns = []
+            self.exclude_patterns = ()
         else:
             self.exclude_patterns = exclusions.STANDARD_EXCLUDE_PATTERNS
             if self.live_fs_exclusions:
-                self.exclude_patterns.extend(exclusions.ADD_LIVEFS_EXCLUDE_PATTERNS)
+                self.exclude_patterns += exclusions.ADD_LIVEFS_EXCLUDE_PATTERNS
 
         self.echo(
             DEBUG, "exclude patterns= \n{}".format(pp.pformat(self.exclude_patterns))
         )
+        # Rules from the exclude-from files (in the order of the files)
+        self.filter_rules = ()
+        for fpath in self.exclude_from:
+            try:
+                self.filter_rules += tuple(exclusions.read_filter_file(fpath))
+            except ValueError as err:
+                raise click.BadParameter(str(err), param_hint='exclude-from')
+        self.echo(DEBUG, "filter rules= \n{}".format(pp.pformat(self.filter_rules)))
+        # Shared with other Comparers using the same exclusions
+        self.exclude_matcher = exclusions.get_matcher(
+            self.exclude_patterns,
+            relative_fs_top=self.relative_fs_top,
+            filter_rules=self.filter_rules,
+        )
 
         # Keep track whether pattern was already used in a first match:
         self.used_exclude_patterns = set([])
-        # Memorise paths of the files in DIR1 to be compared:
-        self.files_to_compare = []
+        # Hit counters and pruned volume per pattern (only for the report)
+        self.exclusion_stats = None
+        if self.exclusion_report is not None:
+            self.exclusion_stats = exclusions.ExclusionStats(
+                self.exclude_matcher.excluding_patterns()
+            )
+        # Memorise the files (CompareItems) in DIR1 to be compared:
+        self.files_to_compare = comparestore.CompareStore(
+            self.fs1,
+            self.fs2,
+            spill_threshold=None if spill_threshold is None else spill_threshold * MIB,
+            read_order=self.read_order,
+        )
+        # In pipelined mode: Queue (and progress bar) of the files to be compared
+        self.compare_queue = None
+        self.compare_display = None
+        # Exception which stopped the compare threads
+        self.compare_error = None
+        # Serialises progress bar updates from the compare threads
+        self.display_lock = threading.Lock()
         # Keep track that ALL comparison are ok:
         self.everything_ok = True
 
@@ -114,9 +331,34 @@ class Comparer:
         self.ok_log = utils.LogFile(
             self.output_path, utils.OK_LOG_DEFAULT_NAME, force_default=True
         )
+        self.exclusion_log = None
+        if self.exclusion_report is not None:
+            self.exclusion_log = utils.LogFile(
+                self.output_path,
+                utils.EXCL_REPORT_DEFAULT_NAMES[self.exclusion_report],
+                force_default=True,
+            )
 
-        # Standard lib filecmp caches file stats.
-        filecmp.clear_cache()
+        # Reads the file contents with a thread pool per device (optional)
+        self.device_scheduler = None
+        if fs1_device_workers is not None or fs2_device_workers is not None:
+            self.device_scheduler = devices.DeviceScheduler(
+                self.fs1,
+                self.fs2,
+                fs1_device_workers or self.compare_workers,
+                fs2_device_workers or self.compare_workers,
+            )
+
+        # Compares the file contents (holds the reusable read buffers)
+        self.content_comparer = filecompare.ContentComparer(
+            chunk_size=compare_chunk_size * MIB,
+            scheduler=self.device_scheduler,
+            large_file_size=None if large_file_size is None else large_file_size * MIB,
+            range_workers=range_workers,
+            engine=compare_engine,
+            cache_policy=cache_policy,
+            small_file_size=small_file_size * 1024,
+        )
 
     def in_debug_mode(self):
         """Are in debug mode?"""
@@ -191,47 +433,78 @@ class Comparer:
             except AttributeError:
                 click.echo(msg)
 
-    def make_fs2_path(self, path):
-        """
-        Generate a path under dir2 from a path under dir1
+    def add_to_compare(self, item: filecompare.CompareItem):
+        """Add to the files_to_compare list (or the compare_queue if pipelined)"""
+        if self.compare_queue is not None:
+            with self.display_lock:
+                self.compare_display.total += 1
+            self.compare_queue.put(item)
+        else:
+            self.files_to_compare.append(item)
+
+    def add_file_entry_to_compare(self, node: DirNode, entry1, entry2):
         """
-        rel = Path(path).relative_to(self.fs1)
-        return self.fs2.joinpath(rel)
+        Add a file found by the traversal to the files to compare
 
-    def add_to_compare(self, path1: Path):
-        """Add to the files_to_compare list"""
+        Keeps the stat results of both entries, so the compare phase doesn't
+        need to stat the files again.
+        """
         if not self.traversal_only:
-            self.files_to_compare.append(path1)
+            try:
+                sig1 = filecompare.stat_signature(entry1.stat(follow_symlinks=False))
+                st2 = entry2.stat(follow_symlinks=False)
+                sig2 = filecompare.stat_signature(st2)
+                inode2 = st2.st_ino
+            except OSError:
+                # Let the compare phase find out (and report) what's wrong
+                sig1 = sig2 = None
+                inode2 = 0
+            name = entry1.name
+            if self.compare_queue is None:
+                # Stored by directory and name: No Paths needed
+                self.files_to_compare.append_entry(
+                    node.rel_dir, name, sig1, sig2, inode2
+                )
+            else:
+                self.add_to_compare(
+                    filecompare.CompareItem(
+                        node.path1.joinpath(name), node.path2.joinpath(name), sig1, sig2
+                    )
+                )
 
-    def cmp_list_symlink_entry(self, ekind, e_in_1, e_in_2):
+    def cmp_list_symlink_entry(self, ekind, node: DirNode, name: str):
         """
         Compare list entry which is a symlink
         """
-        lnk_in_1 = os.readlink(e_in_1)
+        lnk_in_1 = os.readlink(node.entry_path1(name), dir_fd=node.dir_fd1)
 
         try:
-            lnk_in_2 = os.readlink(e_in_2)
+            lnk_in_2 = os.readlink(node.entry_path2(name), dir_fd=node.dir_fd2)
             if lnk_in_1 == lnk_in_2:
-                self.ok(ErrorKind.DIFF, FileKind.SYMLINK, e_in_1)
+                self.ok(ErrorKind.DIFF, FileKind.SYMLINK, node.path1.joinpath(name))
             else:
-                self.error(ErrorKind.DIFF, FileKind.SYMLINK, e_in_1)
+                self.error(ErrorKind.DIFF, FileKind.SYMLINK, node.path1.joinpath(name))
         except OSError:
             # entry still might exists (just not a symlink!)
-            if e_in_2.exists():
-                self.error(ErrorKind.MISMATCH, FileKind.SYMLINK, e_in_1)
+            if scanner.exists(node.entry_path2(name), dir_fd=node.dir_fd2):
+                self.error(
+                    ErrorKind.MISMATCH, FileKind.SYMLINK, node.path1.joinpath(name)
+                )
             else:
-                self.error(ErrorKind.NOT_EXIST_IN_2, ekind, e_in_1)
+                self.error(ErrorKind.NOT_EXIST_IN_2, ekind, node.path1.joinpath(name))
 
-    def cmp_dir_or_file_entry(self, ikind, e_in_1, e_in_2):
+    def cmp_dir_or_file_entry(self, ikind, node: DirNode, entry1, entry2):
         """
         Compare list entry which is a real directory or file
 
+        :param entry1: The os.DirEntry in node.path1
+        :param entry2: The os.DirEntry in node.path2 (its type info is cached)
         :return: whether this entry should be kept for traversal
         """
         keep = False
-        if not e_in_2.is_symlink():
+        if not entry2.is_symlink():
             if ikind is FileKind.FILE:
-                self.add_to_compare(e_in_1)
+                self.add_file_entry_to_compare(node, entry1, entry2)
             else:
                 # Do bot record DIR as identical (because their files might differ)
                 # self.ok(ikind, e_in_1)
@@ -239,85 +512,100 @@ class Comparer:
                 # Keep this entry (a dir) for traversal!
                 keep = True
         else:
-            # e_in_2 is a symlink
+            # The entry in FS2 is a symlink
             self.error(
-                ErrorKind.MISMATCH, ikind, e_in_2, comment="FS2 entry is symlink"
+                ErrorKind.MISMATCH,
+                ikind,
+                node.path2.joinpath(entry2.name),
+                comment="FS2 entry is symlink",
             )
         return keep
 
-    def cmp_list(self, master_list, list2, ikind: FileKind, path1: Path, path2: Path):
+    def cmp_entry(self, entry1, entry2, ikind: FileKind, node: DirNode):
         """
-        Compare whether a file entry list from path1 exists in path2
-        In the case of files attempt a content comparison.
-
-        :param master_list: the file of either directories or files
-        :param ikind: the FileKind of the items in the list
-                      (directories or files)
+        Compare one entry from node.path1 with the same named entry from node.path2
 
-        Note: This function removes items from master_list when the comparision failed
+        :param entry1: the os.DirEntry in node.path1
+        :param entry2: the os.DirEntry of the same kind in node.path2 or None
+        :return: whether this entry can be traversed into
         """
+        e = entry1.name
 
-        loop_list = master_list.copy()
-        reduce_list2 = list2.copy()
-        for e in loop_list:
-            e_in_1 = path1.joinpath(e)
-            e_in_2 = path2.joinpath(e)
-
-            # Tracks whether entry e can be traversed into
-            keep_on_master_list = False
-            if not self.excluded(e_in_1,self.fs1):
-                try:
-                    if e_in_1.is_symlink():
-                        # The "directory" or "file" might be a symlink:
-                        self.cmp_list_symlink_entry(ikind, e_in_1, e_in_2)
+        keep = False
+        # Note: Relative to their FS tops, the entries in FS1 and FS2 have the same
+        #       path, so the exclusion result holds for both
+        # Paths are only built when needed (most entries don't need them)
+        pruned_path = node.path1.joinpath(e) if self.exclusion_stats else None
+        if not self.excluded_pathstr(node.rel_prefix + e, node.anchored, pruned_path):
+            try:
+                if entry1.is_symlink():
+                    # The "directory" or "file" might be a symlink:
+                    self.cmp_list_symlink_entry(ikind, node, e)
 
+                else:
+                    # Real directory or file
+                    if entry2 is not None:  # this is equivalent to
+                        # `if is_dir/is_file(e_in_2)`
+                        keep = self.cmp_dir_or_file_entry(ikind, node, entry1, entry2)
                     else:
-                        # Real directory or file
-                        if e in reduce_list2:  # this is equivalent to
-                            # `if is_dir/is_file(e_in_2)`
-                            if self.cmp_dir_or_file_entry(ikind, e_in_1, e_in_2):
-                                # Keep this entry (a dir) for traversal!
-                                keep_on_master_list = True
-                        else:
-                            if not self.excluded(e_in_2, self.fs2):
-                                self.error(ErrorKind.NOT_EXIST_IN_2, ikind, e_in_1)
-                except PermissionError as err:
-                    debug.dbg_long_exception(err)
-                    # We get here if we have a permission error in e1
-                    # So lets try the same to e2
-                    try:
-                        e_in_2.is_symlink()
-                        # e2 is readable, so e1 is a **singular** NOACCESS error
                         self.error(
-                            ErrorKind.NOACCESS,
-                            ikind,
-                            e_in_1,
-                            comment="FS1 entry not accessible",
+                            ErrorKind.NOT_EXIST_IN_2, ikind, node.path1.joinpath(e)
                         )
+            except PermissionError as err:
+                debug.dbg_long_exception(err)
+                e_in_1 = node.path1.joinpath(e)
+                e_in_2 = node.path2.joinpath(e)
+                # We get here if we have a permission error in e1
+                # So lets try the same to e2
+                try:
+                    e_in_2.is_symlink()
+                    # e2 is readable, so e1 is a **singular** NOACCESS error
+                    self.error(
+                        ErrorKind.NOACCESS,
+                        ikind,
+                        e_in_1,
+                        comment="FS1 entry not accessible",
+                    )
 
-                    except PermissionError as err2:
-                        debug.dbg_long_exception(err2)
-                        self.error(
-                            ErrorKind.NOACCESS, ikind, e_in_2, "FS2 entry not accessible"
-                        )
+                except PermissionError as err2:
+                    debug.dbg_long_exception(err2)
+                    self.error(
+                        ErrorKind.NOACCESS, ikind, e_in_2, "FS2 entry not accessible"
+                    )
+        return keep
 
-            if e in reduce_list2:  # doesn't need to be in list2
-                reduce_list2.remove(e)
+    def cmp_list(self, entries1, entries2, ikind: FileKind, node: DirNode):
+        """
+        Compare whether the entries from node.path1 exist in node.path2
+        In the case of files attempt a content comparison.
 
-            if not keep_on_master_list:
-                # The following removes the element from in the
-                # **passed-in** list so that os.walk doesn't go into it
-                # (if it is a directory)
-                master_list.remove(e)
+        :param entries1: the os.DirEntry list of either directories or files in path1
+        :param entries2: the os.DirEntry list of the same kind in path2
+        :param ikind: the FileKind of the items in the list
+                      (directories or files)
+        :return: the entries of entries1 which can be traversed into (sorted by name)
+        """
+        joined = scanner.join_entries(entries1, entries2)
 
+        keep_list = []
+        for entry1, entry2 in joined.both:
+            if self.cmp_entry(entry1, entry2, ikind, node):
+                # Keep this entry (a dir) for traversal!
+                keep_list.append(entry1)
             self.display.update()
 
-        if len(reduce_list2) > 0:
-            for extra in reduce_list2:
-                e_in_2 = path2.joinpath(extra)
-                if not self.excluded(e_in_2, self.fs2) and \
-                   not self.ignore_missing_in_fs1:
-                    self.error(ErrorKind.NOT_EXIST_IN_1, ikind, e_in_2)
+        for entry1 in joined.only1:
+            self.cmp_entry(entry1, None, ikind, node)
+            self.display.update()
+
+        if not self.ignore_missing_in_fs1:
+            for extra in joined.only2:
+                pathstr = node.rel_prefix + extra.name
+                extra_in_2 = node.path2.joinpath(extra.name)
+                if not self.excluded_pathstr(pathstr, node.anchored, extra_in_2):
+                    self.error(ErrorKind.NOT_EXIST_IN_1, ikind, extra_in_2)
+
+        return keep_list
 
     def excluded(self, path, ref_fs):
         """
@@ -327,28 +615,55 @@ class Comparer:
         :return: Whether path should be excluded
         """
         # path_from_top
-        pathstr = '/' + str(Path(path).relative_to(ref_fs))
-
-        for pat in self.exclude_patterns:
-            front_only = False
-            if pat.startswith('/'):
-                pat = pat[1:]
-                if not self.relative_fs_top:
-                    front_only = True
+        return self.excluded_pathstr(
+            '/' + str(Path(path).relative_to(ref_fs)), path=Path(path)
+        )
 
-            if front_only:
-                match_pat = '/' + pat
-            else:
-                match_pat = '*/' + pat
+    def excluded_pathstr(self, pathstr: str, anchored: bool = True, path=None):
+        """
+        Check whether a path is excluded through the exclude_patterns
+        :param pathstr: Path relative to the filesystem top, starting with '/'
+        :param anchored: Whether patterns anchored at the top can match (see
+                         DirNode.anchored)
+        :param path: The real path (for the exclusion statistics)
+        :return: Whether path should be excluded
+        """
+        if self.exclusion_stats is None:
+            pat = self.exclude_matcher.match(pathstr, anchored)
+        else:
+            # Credit the first listed pattern, not any matching one
+            match = functools.partial(self.exclude_matcher.match, first=True)
+            pat = self.timed_match(match, pathstr, anchored)
+        return self.used_pattern(pat, pathstr, path)
+
+    def timed_match(self, match, pathstr: str, anchored: bool):
+        """Call match(pathstr, anchored) and count it in the exclusion statistics"""
+        if self.exclusion_stats is None:
+            return match(pathstr, anchored)
+        start = time.perf_counter()
+        pat = match(pathstr, anchored)
+        self.exclusion_stats.record_check(pat, time.perf_counter() - start)
+        return pat
+
+    def used_pattern(self, pat, pathstr: str, path=None, children_only=False):
+        """
+        Keep track of an exclusion pattern used for pathstr
 
-            if fnmatch.fnmatch(pathstr, match_pat):
-                if not pat in self.used_exclude_patterns:
-                    self.echo(
-                        DEBUG, "Pattern '{}' used (1st time for '{}')", pat, pathstr
-                    )
-                    self.used_exclude_patterns.add(pat)
-                return True
-        return False
+        :param pat: The pattern or None (if no pattern matched)
+        :param path: The real path (for the exclusion statistics)
+        :param children_only: Only the entries of path are excluded
+        :return: Whether a pattern matched
+        """
+        if pat is None:
+            return False
+        if not pat in self.used_exclude_patterns:
+            self.echo(DEBUG, "Pattern '{}' used (1st time for '{}')", pat, pathstr)
+            self.used_exclude_patterns.add(pat)
+        if self.exclusion_stats is not None and path is not None:
+            self.exclusion_stats.record_pruned(
+                pat, scanner.tree_volume(path, children_only)
+            )
+        return True
 
     def oswalk_error(self, e:OSError):
         ikind = FileKind.UNKOWN
@@ -366,39 +681,202 @@ class Comparer:
             comment = f"UNEXPECTED {e}"
         self.error(ErrorKind.NOACCESS, ikind, e.filename, comment=comment)
 
+    def scan_dir_pair(self, node: DirNode):
+        """
+        List a directory of FS1 and its counterpart in FS2
+
+        Touches only the filesystems (no reporting), so it can run in a worker thread.
+
+        :return: tuple of the listings of FS1 and FS2 (each can be None)
+                 and the list of OSErrors which occurred
+        """
+        listing2 = None
+        listing1, errors = self.scan_dir_side(node, 1)
+        if listing1 is not None:
+            listing2, errors2 = self.scan_dir_side(node, 2)
+            errors.extend(errors2)
+        return listing1, listing2, errors
+
+    def scan_dir_side(self, node: DirNode, side: int):
+        """
+        List the directory of node in FS1 (side 1) or FS2 (side 2)
+
+        Touches only one filesystem, so FS1 and FS2 can be listed by separate
+        threads (see split_scan).
+
+        :return: tuple of the listing (None if it failed) and the list of OSErrors
+        """
+        errors = []
+        path = node.path1 if side == 1 else node.path2
+        if node.fds is not None:
+            parent_fd = None
+            if node.parent_fds is not None:
+                parent_fds = node.parent_fds
+                parent_fd = parent_fds.fd1 if side == 1 else parent_fds.fd2
+            fd, listing = self.scan_dir_at(path, parent_fd, errors)
+            if side == 1:
+                node.fds.fd1 = fd
+            else:
+                node.fds.fd2 = fd
+        else:
+            listing = scanner.scan_dir(path, onerror=errors.append)
+
+        if listing is not None and self.split_scan and not self.traversal_only:
+            # Fetch size and mtime (for the compare) on this filesystem's thread
+            for entry in listing.files:
+                try:
+                    entry.stat(follow_symlinks=False)
+                except OSError:
+                    pass
+        return listing, errors
+
+    @staticmethod
+    def scan_dir_at(path: Path, parent_fd, errors):
+        """
+        Open and list the directory path (relative to parent_fd if not None)
+
+        :return: See scanner.scan_dir_at()
+        """
+
+        def onerror(err: OSError):
+            # Report the full path (not just the name relative to parent_fd)
+            errors.append(OSError(err.errno, err.strerror, str(path)))
+
+        if parent_fd is None:
+            return scanner.scan_dir_at(path, onerror=onerror)
+        return scanner.scan_dir_at(path.name, dir_fd=parent_fd, onerror=onerror)
+
+    def make_subdir_node(self, node: DirNode, name: str):
+        """
+        The DirNode for the subdirectory name of node
+
+        :return: The DirNode or None if all entries of the subdirectory are excluded
+                 (so it doesn't even need to be listed)
+        """
+        pathstr = node.rel_prefix + name
+        matcher = self.exclude_matcher
+        pat = self.timed_match(matcher.children_excluded, pathstr, node.anchored)
+        path1 = node.path1.joinpath(name)
+        if self.used_pattern(pat, pathstr, path1, children_only=True):
+            return None
+        rel_prefix = pathstr + '/'
+        if node.fds is not None:
+            # The subdirectory is opened relative to them
+            node.fds.acquire()
+        return DirNode(
+            path1,
+            node.path2.joinpath(name),
+            rel_prefix,
+            # Once no anchored pattern is possible, the whole subtree inherits that
+            node.anchored and matcher.anchored_possible(rel_prefix),
+            node.fds,
+            self.dir_fds,
+        )
+
+    def traverse_dir(self, node: DirNode, scanned):
+        """
+        Compare one directory level of FS1 with its counterpart in FS2
+
+        :param scanned: The result of scan_dir_pair(node)
+        :return: the DirNodes of the subdirectories to traverse into
+        """
+        listing1, listing2, errors = scanned
+        for err in errors:
+            self.oswalk_error(err)
+        if listing1 is None:
+            return []
+        if listing2 is None:
+            self.error(ErrorKind.NOT_EXIST_IN_2, FileKind.DIR, node.path1)
+            return []
+
+        subdirs = self.cmp_list(listing1.dirs, listing2.dirs, FileKind.DIR, node)
+        self.cmp_list(listing1.files, listing2.files, FileKind.FILE, node)
+        subdir_nodes = [self.make_subdir_node(node, entry.name) for entry in subdirs]
+        return [subdir for subdir in subdir_nodes if subdir is not None]
+
+    def prefetch_listings(self, pools, stack):
+        """
+        Submit the listings of the directories next in line to the thread pools
+
+        With one pool, it lists FS1 and FS2, with two pools (split_scan) the
+        first lists FS1 and the second FS2.
+        Only the top of the stack (the directories traversed next) is prefetched,
+        so the number of listings held in memory stays bounded.
+        """
+        for node in stack[-self.traverse_workers * PREFETCH_PER_WORKER :]:
+            if node.listing is None:
+                if len(pools) == 2:
+                    node.listing = (
+                        pools[0].submit(self.scan_dir_side, node, 1),
+                        pools[1].submit(self.scan_dir_side, node, 2),
+                    )
+                else:
+                    node.listing = pools[0].submit(self.scan_dir_pair, node)
+
+    def listing_result(self, node: DirNode):
+        """
+        The listing of node (see scan_dir_pair()), prefetched or listed now
+        """
+        if node.listing is None:
+            return self.scan_dir_pair(node)
+        if not isinstance(node.listing, tuple):
+            return node.listing.result()
+
+        # Join the listings of the separate FS1 and FS2 scanners
+        future1, future2 = node.listing
+        listing1, errors = future1.result()
+        listing2, errors2 = future2.result()
+        if listing1 is None:
+            # As for scan_dir_pair(): FS2 only counts if FS1 could be listed
+            return None, None, errors
+        return listing1, listing2, errors + errors2
+
     def work_phase1_traverse(self):
         """Traverse the filesystems"""
         self.echo(DEBUG, "*** TRAVERSAL PHASE")
+        pools = []
         try:
             self.display = Display(mode=OpMode.TRAVERSE, disable=self.disable_progress)
-            for dirpath, subdirs, filenames in os.walk(self.fs1, onerror=self.oswalk_error):
-                # Not sure whether the following excluded() call is not/cannot be
-                # covered by the excluded() call in cmp_list...
-                if not self.excluded(dirpath, self.fs1):
-                    dirpath = Path(dirpath)
-                    dir2path = self.make_fs2_path(dirpath)
-                    # Get the dirs and files under dir2path
-                    walked_into_dir2path = False
-                    for dirpath2_walk, subdirs2_walk, filenames2_walk in os.walk(
-                        dir2path, onerror=self.oswalk_error
-                    ):
-                        walked_into_dir2path = True
-                        subdirs2 = subdirs2_walk.copy()
-                        filenames2 = filenames2_walk.copy()
-                        subdirs2_walk.clear()
-                    if walked_into_dir2path:
-                        if not dir2path.is_symlink():
-                            self.cmp_list(
-                                subdirs, subdirs2, FileKind.DIR, dirpath, dir2path
-                            )
-                            self.cmp_list(
-                                filenames, filenames2, FileKind.FILE, dirpath, dir2path
-                            )
-                        else:
-                            self.error(ErrorKind.MISMATCH, FileKind.DIR, dirpath)
-                    else:
-                        self.error(ErrorKind.NOT_EXIST_IN_2, FileKind.DIR, dirpath)
+            if self.excluded(self.fs1, self.fs1):
+                return
+            if self.fs2.is_symlink():
+                # Subdirectories which are symlinks are caught by cmp_list
+                self.error(ErrorKind.MISMATCH, FileKind.DIR, self.fs1)
+                return
+
+            if self.split_scan:
+                # Separate scanners: The slower filesystem sets the pace
+                pools = [
+                    ThreadPoolExecutor(max_workers=self.traverse_workers)
+                    for _ in (self.fs1, self.fs2)
+                ]
+            elif self.traverse_workers > 1:
+                pools = [ThreadPoolExecutor(max_workers=self.traverse_workers)]
+
+            # Depth first, in name order. The listings are done by the worker
+            # threads (if any), but all comparing and reporting happens here in
+            # the same order as for a single thread, so logs are deterministic.
+            stack = [
+                DirNode(
+                    self.fs1,
+                    self.fs2,
+                    '/',
+                    self.exclude_matcher.anchored_possible('/'),
+                    open_fds=self.dir_fds,
+                )
+            ]
+            while stack:
+                if pools:
+                    self.prefetch_listings(pools, stack)
+                node = stack.pop()
+                scanned = self.listing_result(node)
+                try:
+                    stack.extend(reversed(self.traverse_dir(node, scanned)))
+                finally:
+                    node.release_fds()
         finally:
+            for pool in pools:
+                pool.shutdown()
             self.display.close()
 
     def work_phase1_from_list(self, traverse_from_list: str):
@@ -406,19 +884,55 @@ class Comparer:
         travlistp = Path(traverse_from_list)
         with open(travlistp) as travlistf:
             for l in map(str.strip, travlistf.readlines()):
-                self.add_to_compare(self.fs1 / l)
+                if not l:
+                    continue
+                if not self.traversal_only:
+                    path1 = self.fs1 / l
+                    self.add_to_compare(
+                        filecompare.CompareItem(
+                            path1, self.fs2 / l, filecompare.path_signature(path1)
+                        )
+                    )
 
-    def phase2_compare_file(self, path1, path2: Path):
-        """Do real compare for a FILE"""
-        res = filecmp.cmp(path1, path2, shallow=self.shallow_compare)
+    def phase2_compare_file(self, path1, path2: Path, sig1=None, sig2=None):
+        """
+        Do real compare for a FILE
+
+        :param sig1/sig2: Stat signatures of path1/path2 if already known
+        """
+        if sig1 is not None and self.content_comparer.is_large(sig1[1]):
+            res = self.phase2_compare_large_file(path1, path2, sig1, sig2)
+        else:
+            res = self.content_comparer.cmp(
+                path1, path2, shallow=self.shallow_compare, sig1=sig1, sig2=sig2
+            )
         if res:
             self.ok(FileKind.FILE, path1)
         else:
             self.error(ErrorKind.DIFF, FileKind.FILE, path1)
 
+    def phase2_compare_large_file(self, path1, path2: Path, sig1, sig2):
+        """Compare a large file in byte ranges with a progress bar in bytes"""
+        display = self.display if self.compare_queue is None else self.compare_display
+        with self.display_lock:
+            bar = display.byte_bar(path1.name, sig1[1])
+        try:
+            return self.content_comparer.cmp(
+                path1,
+                path2,
+                shallow=self.shallow_compare,
+                sig1=sig1,
+                sig2=sig2,
+                progress=bar.update,
+            )
+        finally:
+            with self.display_lock:
+                bar.close()
+
     def phase2_compare_symlink(self, path1, path2):
         """Do the compare for a DIR: Just check that both are dirs"""
-        self.cmp_list_symlink_entry(FileKind.SYMLINK, path1, path2)
+        node = DirNode(path1.parent, path2.parent, '/', False)
+        self.cmp_list_symlink_entry(FileKind.SYMLINK, node, path1.name)
 
     def phase2_compare_dir(self, path1, path2):
         """Do the compare for a DIR: Just check that both are dirs"""
@@ -428,6 +942,104 @@ class Comparer:
         else:
             self.error(ErrorKind.DIFF, FileKind.DIR, path1)
 
+    def compare_item(self, item: filecompare.CompareItem):
+        """Compare one entry of the files_to_compare list with its FS2 counterpart"""
+        path1 = item.path1
+        path2 = item.path2
+        try:
+            if item.sig1 is not None:
+                ftype = item.sig1[0]
+            elif path1.is_dir():
+                ftype = stat.S_IFDIR
+            elif path1.is_symlink():
+                ftype = stat.S_IFLNK
+            else:
+                ftype = None
+
+            if ftype == stat.S_IFDIR:
+                self.phase2_compare_dir(path1, path2)
+            elif ftype == stat.S_IFLNK:
+                self.phase2_compare_symlink(path1, path2)
+            else:
+                self.phase2_compare_file(path1, path2, item.sig1, item.sig2)
+        except PermissionError as e:
+            details = f"{e} " if self.in_debug_mode() else ""
+            comment = f"PermissionError {details}as user {utils.get_username()}"
+            self.error(ErrorKind.NOACCESS, FileKind.FILE, path1, comment=comment)
+        except OSError as e:
+            comment = f"OSError {e} as user {utils.get_username()}"
+            self.error(ErrorKind.NOACCESS, FileKind.FILE, path1, comment=comment)
+
+    def compare_worker(self, next_batch, display):
+        """
+        Compare batches of items until next_batch() returns an empty batch
+
+        Runs as one of the compare threads. After an unexpected exception (in any
+        compare thread) the remaining items are only fetched, not compared, so a
+        producer never blocks on a full queue.
+        """
+        while True:
+            batch = next_batch()
+            if not batch:
+                break
+            if self.compare_error is not None:
+                continue
+            try:
+                with self.display_lock:
+                    display.update(len(batch))
+                for item in batch:
+                    self.compare_item(item)
+            except BaseException as err:
+                self.compare_error = err
+
+    def next_compare_batch(self, items, held: list):
+        """
+        The next items for a compare thread
+
+        Small files (see ContentComparer.is_small) are taken in batches. Any
+        other item is handed out alone, so it doesn't wait behind a batch.
+
+        :param held: The item which ended the previous batch (if any), handed
+                     out next
+        """
+        if held:
+            return [held.pop()]
+        batch = []
+        for item in items:
+            if not self.content_comparer.is_small(item.sig1):
+                if batch:
+                    held.append(item)
+                    break
+                return [item]
+            batch.append(item)
+            if len(batch) >= COMPARE_BATCH_SIZE:
+                break
+        return batch
+
+    def next_queued_batch(self):
+        """The next item from the compare_queue as batch (empty at the end)"""
+        item = self.compare_queue.get()
+        return [] if item is None else [item]
+
+    def start_compare_threads(self, next_batch, display):
+        """Start compare_workers threads running compare_worker"""
+        threads = [
+            threading.Thread(
+                target=self.compare_worker, args=(next_batch, display), daemon=True
+            )
+            for _ in range(self.compare_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def join_compare_threads(self, threads):
+        """Wait for the compare threads and pass on an exception which stopped them"""
+        for thread in threads:
+            thread.join()
+        if self.compare_error is not None:
+            raise self.compare_error
+
     def work_phase2_compare(self):
         """Compare the files in the files_to_compare list"""
         self.echo(DEBUG, "*** COMPARE PHASE")
@@ -438,27 +1050,55 @@ class Comparer:
                 disable=self.disable_progress,
             )
 
-            for path1 in self.files_to_compare:
-                self.display.update()
-                path2 = self.make_fs2_path(path1)
-                try:
-                    if path1.is_dir():
-                        self.phase2_compare_dir(path1, path2)
-                    elif path1.is_symlink():
-                        self.phase2_compare_symlink(path1, path2)
-                    else:
-                        self.phase2_compare_file(path1, path2)
-                except PermissionError as e:
-                    details = f"{e} " if self.in_debug_mode() else ""
-                    comment = f"PermissionError {details}as user {utils.get_username()}"
-                    self.error(ErrorKind.NOACCESS, FileKind.FILE, path1, comment=comment)
-                except OSError as e:
-                    comment = f"OSError {e} as user {utils.get_username()}"
-                    self.error(ErrorKind.NOACCESS, FileKind.FILE, path1, comment=comment)
+            items = self.files_to_compare
+            if self.prefetch:
+                items = prefetch.Prefetcher(items, self.prefetch)
+
+            if self.compare_workers > 1:
+                items = iter(items)
+                items_lock = threading.Lock()
+                held = []
+
+                def next_batch():
+                    with items_lock:
+                        return self.next_compare_batch(items, held)
+
+                threads = self.start_compare_threads(next_batch, self.display)
+                self.join_compare_threads(threads)
+            else:
+                for item in items:
+                    self.display.update()
+                    self.compare_item(item)
 
         finally:
             self.display.close()
 
+    def work_pipelined(self):
+        """
+        Traverse and compare at the same time
+
+        Files found by the traversal go through the bounded compare_queue to the
+        compare threads, so the content reading overlaps the directory listing.
+        """
+        self.echo(DEBUG, "*** TRAVERSAL + COMPARE PHASE (PIPELINED)")
+        self.compare_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.compare_display = Display(
+            total=0, mode=OpMode.COMPARE, disable=self.disable_progress
+        )
+        threads = self.start_compare_threads(
+            self.next_queued_batch, self.compare_display
+        )
+        try:
+            self.work_phase1_traverse()
+        finally:
+            for _ in threads:
+                self.compare_queue.put(None)
+            try:
+                self.join_compare_threads(threads)
+            finally:
+                self.compare_display.close()
+                self.compare_queue = None
+
     def error_report(self):
         """Print error report"""
         num_of_lines = 5
@@ -486,22 +1126,53 @@ class Comparer:
             )
         self.echo(INFO, "".join(report).strip())
 
+    def device_report(self):
+        """Print the read statistics of each device"""
+        for st in self.device_scheduler.stats():
+            self.echo(
+                INFO,
+                f"Device {st['device']} ({st['name']}): {st['limit']} workers, "
+                f"{st['reads']} reads, {st['bytes'] / MIB:.1f} MiB in "
+                f"{st['seconds']:.1f}s, max {st['max_pending']} reads queued",
+            )
+
+    def write_exclusion_report(self):
+        """Write the exclusion statistics to the exclusion report file"""
+        if self.exclusion_report == 'json':
+            report = json.dumps(self.exclusion_stats.as_dict(), indent=2)
+        else:
+            report = self.exclusion_stats.report_text()
+        self.exclusion_log.write(report)
+        self.echo(INFO, f"Exclusion statistics in file '{self.exclusion_log.fpath}'")
+
     def work(self):
         try:
-            if self.traverse_from_list is None:
-                # Normal case: generate files_to_compare by traversal
-                # self.echo(DEBUG,
-                self.work_phase1_traverse()
-            else:
+            if self.traverse_from_list is not None:
                 # Special case: Get files_to_compare from external file
                 self.work_phase1_from_list(self.traverse_from_list)
-
-            # debug.dbg_print_ftc_list(self.files_to_compare)
-            self.work_phase2_compare()
+                self.work_phase2_compare()
+            elif self.pipeline and not self.traversal_only:
+                # Compare files while the traversal is still running
+                self.work_pipelined()
+            else:
+                # Normal case: generate files_to_compare by traversal
+                self.work_phase1_traverse()
+                # debug.dbg_print_ftc_list(self.files_to_compare)
+                self.work_phase2_compare()
         finally:
+            self.files_to_compare.close()
+            self.content_comparer.close()
+            if self.device_scheduler is not None:
+                self.device_scheduler.shutdown()
             self.err_log.close_if_needed()
             self.ok_log.close_if_needed()
 
+        if self.device_scheduler is not None:
+            self.device_report()
+
+        if self.exclusion_stats is not None:
+            self.write_exclusion_report()
+
         # Result processing
         if self.everything_ok:
             self.echo(INFO, "Compare ok.")
@@ -0,0 +1,270 @@
+"""
+Compact store for the files to compare
+
+A list of CompareItems costs several hundred bytes per file (two Path objects,
+tuples, floats). CompareStore keeps the same information in flat arrays: a
+table of the directories (each relative path stored once), the encoded names
+in one bytearray and the stat signatures in typed arrays. The CompareItems
+(with their FS1/FS2 paths) are only built when iterating.
+
+For trees larger than RAM the store can spill: Once the arrays in memory
+exceed a threshold, they are written as a segment to a temporary file and
+memory starts over with an empty segment.
+
+With a read order other than discovery each segment is sorted (by inode or
+physical offset in FS2) before its items are returned, so on disks with
+spilled segments the order holds within each segment.
+"""
+import os
+import pickle
+import tempfile
+from array import array
+from pathlib import Path
+
+from cmpdisktree import readorder
+from cmpdisktree.filecompare import CompareItem
+
+# Stored as file type for an unknown signature (S_IFMT() is never 0 for a real node)
+NO_SIGNATURE = 0
+# Rough memory overhead of a directory table entry (str object plus dict slot)
+DIR_ENTRY_OVERHEAD = 150
+
+
+class SignatureArrays:
+    """The stat signatures (type, size, mtime) of one side in typed arrays"""
+
+    def __init__(self):
+        self.types = array('L')
+        self.sizes = array('q')
+        self.mtimes = array('d')
+
+    def append(self, sig):
+        if sig is None:
+            sig = (NO_SIGNATURE, 0, 0.0)
+        self.types.append(sig[0])
+        self.sizes.append(sig[1])
+        self.mtimes.append(sig[2])
+
+    def get(self, i):
+        if self.types[i] == NO_SIGNATURE:
+            return None
+        return (self.types[i], self.sizes[i], self.mtimes[i])
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.types, self.sizes, self.mtimes))
+
+
+class Segment:
+    """A run of stored entries with its own directory table"""
+
+    def __init__(self):
+        # Directory table: relative directory paths and the index for each
+        self.dirs = []
+        self.dir_index = {}
+        self.dirs_nbytes = 0
+
+        # Per entry: directory index, name (as offsets into names) and signatures
+        self.entry_dirs = array('L')
+        self.names = bytearray()
+        self.name_ends = array('Q')
+        self.sigs1 = SignatureArrays()
+        self.sigs2 = SignatureArrays()
+        # Inode number of the file in FS2 (0: not known)
+        self.inodes2 = array('Q')
+
+    def __len__(self):
+        return len(self.entry_dirs)
+
+    def nbytes(self):
+        """Approximate memory used by the segment"""
+        return (
+            self.dirs_nbytes
+            + self.entry_dirs.itemsize * len(self.entry_dirs)
+            + len(self.names)
+            + self.name_ends.itemsize * len(self.name_ends)
+            + self.sigs1.nbytes()
+            + self.sigs2.nbytes()
+            + self.inodes2.itemsize * len(self.inodes2)
+        )
+
+    def append(self, rel_dir: str, name: str, sig1, sig2, inode2=0):
+        index = self.dir_index.get(rel_dir)
+        if index is None:
+            index = len(self.dirs)
+            self.dirs.append(rel_dir)
+            self.dir_index[rel_dir] = index
+            self.dirs_nbytes += len(rel_dir) + DIR_ENTRY_OVERHEAD
+        self.entry_dirs.append(index)
+        self.names += os.fsencode(name)
+        self.name_ends.append(len(self.names))
+        self.sigs1.append(sig1)
+        self.sigs2.append(sig2)
+        self.inodes2.append(inode2)
+
+    def name(self, i):
+        """The name of entry i"""
+        name_start = self.name_ends[i - 1] if i > 0 else 0
+        return os.fsdecode(bytes(self.names[name_start : self.name_ends[i]]))
+
+    def order(self, fs2: Path, read_order: str):
+        """The entry indices sorted for read_order (None: discovery order)"""
+        if read_order == readorder.DISCOVERY:
+            return None
+        keys = [
+            readorder.order_key(
+                read_order,
+                fs2.joinpath(self.dirs[self.entry_dirs[i]], self.name(i)),
+                self.inodes2[i],
+            )
+            for i in range(len(self))
+        ]
+        return sorted(range(len(self)), key=keys.__getitem__)
+
+    def items(self, fs1: Path, fs2: Path, order=None):
+        """
+        Generate the CompareItems of the segment
+
+        :param order: The entry indices in the order to generate (None: as stored)
+        """
+        current_dir = None
+        dir1 = dir2 = None
+        for i in range(len(self)) if order is None else order:
+            dir_index = self.entry_dirs[i]
+            if dir_index != current_dir:
+                current_dir = dir_index
+                dir1 = fs1.joinpath(self.dirs[dir_index])
+                dir2 = fs2.joinpath(self.dirs[dir_index])
+            name = self.name(i)
+            yield CompareItem(
+                dir1.joinpath(name),
+                dir2.joinpath(name),
+                self.sigs1.get(i),
+                self.sigs2.get(i),
+            )
+
+    def __getstate__(self):
+        # The lookup dict is only needed while appending
+        state = self.__dict__.copy()
+        del state['dir_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dir_index = {}
+
+
+class CompareStore:
+    """
+    Append-only store of the CompareItems to compare in phase 2
+
+    Iterating returns the CompareItems in the order they were appended (or
+    sorted for the read order).
+    """
+
+    def __init__(
+        self,
+        fs1: Path,
+        fs2: Path,
+        spill_threshold=None,
+        spill_dir=None,
+        read_order=readorder.DISCOVERY,
+    ):
+        """
+        :param fs1: Top of filesystem 1 (all path1 of the items are under it)
+        :param fs2: Top of filesystem 2
+        :param spill_threshold: Memory (in bytes) above which the entries are moved
+                                to a temporary file (None: keep all in memory)
+        :param spill_dir: Directory for the temporary file (None: system default)
+        :param read_order: One of readorder.READ_ORDERS
+        """
+        self.fs1 = Path(fs1)
+        self.fs2 = Path(fs2)
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.read_order = read_order
+
+        # Parent path of the previous append and its relative path
+        # (files come dir by dir, so this saves most relative_to calls)
+        self.last_parent = None
+        self.last_rel_dir = None
+
+        self.segment = Segment()
+        # Temporary file with the spilled segments and the entries in it
+        self.spill_file = None
+        self.num_spilled = 0
+
+    def __len__(self):
+        return self.num_spilled + len(self.segment)
+
+    def append(self, item: CompareItem):
+        """
+        Store item
+
+        Note: item.path2 is not stored. It is rebuilt from fs2 and the path of
+              path1 relative to fs1.
+        """
+        if item.path1 == self.fs1:
+            # The top itself (a '.' in a traversal list)
+            self.append_entry('.', '.', item.sig1, item.sig2)
+            return
+        parent = item.path1.parent
+        if parent != self.last_parent:
+            self.last_rel_dir = str(parent.relative_to(self.fs1))
+            self.last_parent = parent
+        self.append_entry(self.last_rel_dir, item.path1.name, item.sig1, item.sig2)
+
+    def append_entry(self, rel_dir: str, name: str, sig1=None, sig2=None, inode2=0):
+        """
+        Store the entry name of the directory rel_dir (without building a Path)
+
+        :param rel_dir: Directory relative to fs1 (and fs2) as str, '.' for the top
+        :param inode2: Inode number of the entry in fs2 (0: not known)
+        """
+        self.segment.append(rel_dir, name, sig1, sig2, inode2)
+
+        if (
+            self.spill_threshold is not None
+            and self.segment.nbytes() > self.spill_threshold
+        ):
+            self.spill()
+
+    def spill(self):
+        """Move the entries in memory into the temporary file"""
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(
+                prefix='cmpdisktree-', suffix='.spill', dir=self.spill_dir
+            )
+        self.spill_file.seek(0, os.SEEK_END)
+        pickle.dump(self.segment, self.spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.num_spilled += len(self.segment)
+        self.segment = Segment()
+
+    def spilled_segments(self):
+        """Read the spilled segments back one by one"""
+        if self.spill_file is None:
+            return
+        self.spill_file.flush()
+        pos = 0
+        while True:
+            self.spill_file.seek(pos)
+            try:
+                segment = pickle.load(self.spill_file)
+            except EOFError:
+                break
+            pos = self.spill_file.tell()
+            yield segment
+
+    def __iter__(self):
+        for segment in self.spilled_segments():
+            yield from self.segment_items(segment)
+        yield from self.segment_items(self.segment)
+
+    def segment_items(self, segment: Segment):
+        order = segment.order(self.fs2, self.read_order)
+        return segment.items(self.fs1, self.fs2, order)
+
+    def close(self):
+        """Remove the temporary file (if any)"""
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
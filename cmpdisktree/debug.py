@@ -6,8 +6,8 @@ import traceback
 
 
 def dbg_print_ftc_list(files_to_compare):
-    for path1 in files_to_compare:
-        print(f'To compare: {path1}')
+    for item in files_to_compare:
+        print(f'To compare: {item.path1}')
 
 
 def dbg_long_exception(err):
@@ -0,0 +1,121 @@
+"""
+Per-device I/O scheduling for the compare phase
+
+Each device (st_dev) holding FS1 or FS2 gets a DeviceReader: a pool with its
+own number of threads (and its own queue), which does all content reads from
+that device. So a slow USB backup cannot stall the reads on a fast internal
+disk, and when FS1 and FS2 are on the same device they share one pool and
+one limit.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cmpdisktree.filecompare import pread_full, readinto_full
+
+
+class DeviceReader:
+    """Reads from one device with a limited number of threads"""
+
+    def __init__(self, dev: int, limit: int, name: str):
+        """
+        :param dev: The device number (st_dev)
+        :param limit: Maximal number of reads in flight on the device
+        :param name: Readable name for the statistics (e.g. 'FS1')
+        """
+        self.dev = dev
+        self.limit = limit
+        self.name = name
+        self.pool = ThreadPoolExecutor(max_workers=limit)
+
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        # Reads submitted but not finished (and the maximum of it)
+        self.pending = 0
+        self.max_pending = 0
+
+    def read(self, f, view: memoryview, offset=None):
+        start = time.perf_counter()
+        num = 0
+        try:
+            if offset is None:
+                num = readinto_full(f, view)
+            else:
+                num = pread_full(f, view, offset)
+            return num
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.pending -= 1
+                self.reads += 1
+                self.bytes += num
+                self.seconds += seconds
+
+    def submit(self, f, view: memoryview, offset=None):
+        """
+        Fill view from the file f in one of the device's threads
+
+        :param offset: None: f is a file object read from its position, else:
+                       f is a file descriptor read from this offset
+
+        :return: Future of the number of bytes read (see readinto_full)
+        """
+        with self.lock:
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+        return self.pool.submit(self.read, f, view, offset)
+
+    def stats(self):
+        """The statistics of the device as dict"""
+        with self.lock:
+            return {
+                'device': self.dev,
+                'name': self.name,
+                'limit': self.limit,
+                'reads': self.reads,
+                'bytes': self.bytes,
+                'seconds': self.seconds,
+                'max_pending': self.max_pending,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+class DeviceScheduler:
+    """The DeviceReaders for the devices of FS1 and FS2"""
+
+    def __init__(self, fs1, fs2, limit1: int, limit2: int):
+        """
+        :param fs1: Top of filesystem 1
+        :param fs2: Top of filesystem 2
+        :param limit1: Maximal number of reads in flight on the device of FS1
+        :param limit2: The same for FS2 (if FS1 and FS2 are on the same device,
+                       the smaller limit applies to both)
+        """
+        dev1 = os.stat(fs1).st_dev
+        dev2 = os.stat(fs2).st_dev
+        if dev1 == dev2:
+            self.reader1 = self.reader2 = DeviceReader(
+                dev1, min(limit1, limit2), 'FS1+FS2'
+            )
+        else:
+            self.reader1 = DeviceReader(dev1, limit1, 'FS1')
+            self.reader2 = DeviceReader(dev2, limit2, 'FS2')
+
+    def readers(self):
+        """The distinct DeviceReaders"""
+        if self.reader1 is self.reader2:
+            return [self.reader1]
+        return [self.reader1, self.reader2]
+
+    def stats(self):
+        """The statistics of each device (list of dicts)"""
+        return [reader.stats() for reader in self.readers()]
+
+    def shutdown(self):
+        for reader in self.readers():
+            reader.shutdown()
@@ -2,7 +2,14 @@
 The default exclusion list
 Data from https://bombich.com/kb/ccc5/some-files-and-folders-are-automatically-excluded-from-backup-task
 Last updated 2021-01-27
+
+Plus the ExclusionMatcher which applies exclusion patterns (and the filter
+rules of exclude-from files) to paths.
 """
+import fnmatch
+import functools
+import re
+from typing import NamedTuple
 
 STANDARD_EXCLUDE_PATTERNS_STR = """
 # Filesystem implementation details
@@ -104,8 +111,521 @@ def pattern_list_from_str(pat_str: str):
     ]
 
 
-STANDARD_EXCLUDE_PATTERNS = pattern_list_from_str(STANDARD_EXCLUDE_PATTERNS_STR)
-ADD_LIVEFS_EXCLUDE_PATTERNS = pattern_list_from_str(ADD_LIVEFS_EXCLUDE_PATTERNS_STR)
+# Tuples, so they cannot be changed by accident (combine them with +)
+STANDARD_EXCLUDE_PATTERNS = tuple(pattern_list_from_str(STANDARD_EXCLUDE_PATTERNS_STR))
+ADD_LIVEFS_EXCLUDE_PATTERNS = tuple(
+    pattern_list_from_str(ADD_LIVEFS_EXCLUDE_PATTERNS_STR)
+)
+
+GLOB_CHARS = frozenset('*?[')
+
+
+def is_literal(pat: str):
+    """Whether pat matches only itself (contains no glob characters)"""
+    return not GLOB_CHARS.intersection(pat)
+
+
+def literal_prefix(pat: str):
+    """The part of pat before the first glob character"""
+    for i, c in enumerate(pat):
+        if c in GLOB_CHARS:
+            return pat[:i]
+    return pat
+
+
+def compile_globs(numbered_match_pats):
+    """
+    Compile fnmatch patterns into one regex with a named group per pattern
+
+    :param numbered_match_pats: (number, pattern) pairs, the group of a pattern
+                                is named p<number>
+    :return: The regex (None if there are no patterns)
+    """
+    if not numbered_match_pats:
+        return None
+    return re.compile(
+        '|'.join(
+            f'(?P<p{number}>{fnmatch.translate(match_pat)})'
+            for number, match_pat in numbered_match_pats
+        )
+    )
+
+
+class FilterRule(NamedTuple):
+    """An include or exclude rule from an exclude-from file"""
+
+    include: bool
+    pattern: str
+
+
+# The first word of an rsync filter rule: the rule (short or long name) and
+# its modifiers (see "FILTER RULES" in man rsync)
+FILTER_RULE_RE = re.compile(
+    r'(?P<rule>[-+.:HSPR!]|exclude|include|merge|dir-merge|hide|show|protect'
+    r'|risk|clear)(?P<modifiers>,?[-+/!Csrpxenw]*)'
+)
+# Only these rules (without modifiers) are supported: rule -> include
+SUPPORTED_FILTER_RULES = {'-': False, 'exclude': False, '+': True, 'include': True}
+
+
+def parse_filter_line(line: str):
+    """
+    Parse one line of an exclude-from file (a subset of the rsync filter syntax)
+
+    - Empty lines and lines starting with '#' or ';' are ignored
+    - '- PAT' or 'exclude PAT' excludes, '+ PAT' or 'include PAT' includes
+    - Any other line is an exclude pattern
+    - The patterns match as the standard exclusions
+
+    :return: The FilterRule or None for an ignored line
+    :raises ValueError: For other rsync rules, rule modifiers and patterns
+                        with a trailing '/' (which rsync matches against
+                        directories only)
+    """
+    line = line.rstrip('\r\n')
+    if line == '' or line[0] in '#;':
+        return None
+    include = False
+    first, space, rest = line.partition(' ')
+    m = FILTER_RULE_RE.fullmatch(first) if space else None
+    if m is not None:
+        if m['modifiers'] or m['rule'] not in SUPPORTED_FILTER_RULES:
+            raise ValueError(
+                f"Unsupported filter rule '{first}' (only '-' and '+' without "
+                "modifiers are supported)"
+            )
+        include = SUPPORTED_FILTER_RULES[m['rule']]
+        line = rest
+    if line == '!':
+        raise ValueError("Clearing the rules with '!' is not supported")
+    if line.endswith('/'):
+        raise ValueError(
+            f"Pattern '{line}' for directories only is not supported (use "
+            f"'{line.rstrip('/')}' for files as well or '{line}*' for the "
+            "directory's contents)"
+        )
+    return FilterRule(include, line) if line else None
+
+
+def read_filter_file(path):
+    """
+    Read the rules of an exclude-from file
+
+    :return: List of FilterRules in the order of the file
+    :raises ValueError: With file and line number for an unsupported line
+    """
+    rules = []
+    with open(path, encoding='utf-8', errors='surrogateescape') as f:
+        for line_num, line in enumerate(f, start=1):
+            try:
+                rule = parse_filter_line(line)
+            except ValueError as err:
+                raise ValueError(f"{path}, line {line_num}: {err}") from None
+            if rule is not None:
+                rules.append(rule)
+    return rules
+
+
+class PrefixTrie:
+    """Strings mapped to values, looked up by the strings which start a text"""
+
+    def __init__(self):
+        # Nested dicts keyed by character, the values of a string under None
+        self.root = {}
+
+    def add(self, key: str, value):
+        node = self.root
+        for c in key:
+            node = node.setdefault(c, {})
+        node.setdefault(None, []).append(value)
+
+    def prefix_values(self, text: str, start: int = 0):
+        """The values of all keys which text[start:] starts with"""
+        node = self.root
+        values = list(node.get(None, ()))
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if None in node:
+                values.extend(node[None])
+        return values
+
+    def related(self, text: str):
+        """Whether a key is a prefix of text or text is a prefix of a key"""
+        node = self.root
+        for c in text:
+            if None in node:
+                return True
+            node = node.get(c)
+            if node is None:
+                return False
+        return True
+
+
+class RuleIndex:
+    """
+    Numbered patterns indexed for matching a path
+
+    Finds the lowest numbered matching pattern without trying all patterns:
+    - literal patterns are looked up in hash sets (for the anchored ones the
+      whole path, else the last path components)
+    - glob patterns are looked up in tries by their literal start (for the
+      anchored ones from the top, else from the start of each path component)
+      and only these candidates are matched with their (lazily compiled) regex
+    - the few glob patterns starting with a glob character are combined into
+      one regular expression
+    """
+
+    def __init__(self, numbered_patterns, relative_fs_top=False):
+        """
+        :param numbered_patterns: (number, pattern) pairs in increasing order
+        :param relative_fs_top: Match the patterns starting with '/' at the end of
+                                the path as well
+        """
+        # Literal path (with leading '/') -> number
+        self.anchored_literals = {}
+        # Number of path components -> {literal -> number}
+        self.suffix_literals = {}
+        # Literal prefixes (with leading '/') of all anchored patterns
+        self.anchored_prefixes = PrefixTrie()
+        # Glob patterns by literal prefix (for the anchored ones with leading '/',
+        # the others are looked up from the start of each path component)
+        self.anchored_globs = PrefixTrie()
+        self.component_globs = PrefixTrie()
+        # Number -> fnmatch pattern of the glob patterns and its compiled regex
+        # (the regexes are compiled on first use, the only change after __init__)
+        self.match_pats = {}
+        self.regexes = {}
+
+        unindexed_match_pats = []
+        for number, pat in numbered_patterns:
+            front_only = False
+            if pat.startswith('/'):
+                pat = pat[1:]
+                if not relative_fs_top:
+                    front_only = True
+
+            if front_only:
+                self.anchored_prefixes.add('/' + literal_prefix(pat), number)
+                if is_literal(pat):
+                    self.anchored_literals.setdefault('/' + pat, number)
+                else:
+                    self.match_pats[number] = '/' + pat
+                    self.anchored_globs.add('/' + literal_prefix(pat), number)
+            elif is_literal(pat):
+                literals = self.suffix_literals.setdefault(pat.count('/') + 1, {})
+                literals.setdefault(pat, number)
+            else:
+                prefix = literal_prefix(pat)
+                if prefix:
+                    self.match_pats[number] = '*/' + pat
+                    self.component_globs.add(prefix, number)
+                else:
+                    unindexed_match_pats.append((number, '*/' + pat))
+
+        self.unindexed_regex = compile_globs(unindexed_match_pats)
+
+    def regex(self, number: int):
+        regex = self.regexes.get(number)
+        if regex is None:
+            regex = re.compile(fnmatch.translate(self.match_pats[number]))
+            self.regexes[number] = regex
+        return regex
+
+    def glob_candidates(self, pathstr: str, anchored: bool):
+        """The numbers of the glob patterns which can match pathstr"""
+        candidates = []
+        if anchored:
+            candidates.extend(self.anchored_globs.prefix_values(pathstr))
+        start = pathstr.find('/') + 1
+        while start:
+            candidates.extend(self.component_globs.prefix_values(pathstr, start))
+            start = pathstr.find('/', start) + 1
+        return candidates
+
+    def match(self, pathstr: str, anchored: bool = True, lowest: bool = True):
+        """
+        Match a path against the patterns
+
+        :param pathstr: Path from the filesystem top, starting with '/'
+        :param anchored: Whether the patterns anchored at the top need to be checked
+        :param lowest: Find the lowest numbered matching pattern (else any)
+        :return: The number of the matching pattern or None
+        """
+        best = None
+        if anchored:
+            best = self.anchored_literals.get(pathstr)
+            if best is not None and not lowest:
+                return best
+
+        for num_components, literals in self.suffix_literals.items():
+            parts = pathstr.rsplit('/', num_components)
+            if len(parts) > num_components:
+                number = literals.get('/'.join(parts[1:]))
+                if number is not None and (best is None or number < best):
+                    if not lowest:
+                        return number
+                    best = number
+
+        for number in sorted(self.glob_candidates(pathstr, anchored)):
+            if best is not None and number > best:
+                break
+            if self.regex(number).match(pathstr):
+                if not lowest:
+                    return number
+                best = number
+                break
+
+        if self.unindexed_regex is not None:
+            m = self.unindexed_regex.match(pathstr)
+            if m is not None:
+                number = int(m.lastgroup[1:])
+                if best is None or number < best:
+                    best = number
+        return best
+
+
+class ExclusionMatcher:
+    """
+    Exclusion patterns and filter rules compiled for fast matching
+
+    A pattern starting with '/' matches only at the top of the filesystem (unless
+    relative_fs_top is set), any other pattern matches at the end of the path.
+    The matching is the same as fnmatch with '/PAT' or '*/PAT'.
+
+    The filter rules (from exclude-from files) come first and the first matching
+    rule decides (as in rsync): An include rule keeps the path even if a later
+    rule or an exclusion pattern would match. The exclusion patterns are then
+    applied as exclude rules. The rules are compiled into a RuleIndex, so the
+    time per path barely grows with the number of rules.
+
+    Note: An excluded directory is not traversed, so include rules cannot bring
+          back anything below it.
+
+    A matcher is not changed after construction, so one instance can be shared
+    (see get_matcher()).
+    """
+
+    def __init__(self, patterns, relative_fs_top=False, filter_rules=()):
+        """
+        :param patterns: The exclusion patterns
+        :param relative_fs_top: Match the patterns starting with '/' at the end of
+                                the path as well
+        :param filter_rules: FilterRules applied before the exclusion patterns
+        """
+        self.patterns = tuple(patterns)
+        self.rules = tuple(filter_rules) + tuple(
+            FilterRule(False, pat) for pat in self.patterns
+        )
+        # Without include rules any matching rule excludes
+        self.has_includes = any(rule.include for rule in self.rules)
+        self.index = RuleIndex(
+            ((number, rule.pattern) for number, rule in enumerate(self.rules)),
+            relative_fs_top=relative_fs_top,
+        )
+
+        # Exclude rules PAT/* exclude all entries of a directory matching PAT
+        self.children_index = RuleIndex(
+            (
+                (number, rule.pattern[:-2])
+                for number, rule in enumerate(self.rules)
+                if rule.pattern.endswith('/*') and not rule.include
+            ),
+            relative_fs_top=relative_fs_top,
+        )
+        # Include rules which can keep something below a directory whose children
+        # are excluded: (number, literal prefix) of the anchored ones and the
+        # lowest number of all others
+        self.anchored_includes = []
+        self.lowest_suffix_include = None
+        for number, rule in enumerate(self.rules):
+            if not rule.include:
+                continue
+            if rule.pattern.startswith('/') and not relative_fs_top:
+                self.anchored_includes.append((number, literal_prefix(rule.pattern)))
+            elif self.lowest_suffix_include is None:
+                self.lowest_suffix_include = number
+
+    def display_pattern(self, number: int):
+        """The pattern of rule number as reported (without a leading '/')"""
+        pat = self.rules[number].pattern
+        return pat[1:] if pat.startswith('/') else pat
+
+    def excluding_patterns(self):
+        """The patterns of the exclude rules as returned by match() (in order)"""
+        return list(
+            dict.fromkeys(
+                self.display_pattern(number)
+                for number, rule in enumerate(self.rules)
+                if not rule.include
+            )
+        )
+
+    def match(self, pathstr: str, anchored: bool = True, first: bool = False):
+        """
+        Check whether a path is excluded
+
+        :param pathstr: Path from the filesystem top, starting with '/'
+        :param anchored: Whether the patterns anchored at the top need to be checked
+                         (see anchored_possible())
+        :param first: Return the first listed excluding pattern (else any, if
+                      there are no include rules)
+        :return: The excluding pattern (without a leading '/') or None
+        """
+        number = self.index.match(
+            pathstr, anchored, lowest=first or self.has_includes
+        )
+        if number is None or self.rules[number].include:
+            return None
+        return self.display_pattern(number)
+
+    def anchored_possible(self, dir_prefix: str):
+        """
+        Whether an anchored pattern can match anything below a directory
+
+        If not, the directory and everything below it can skip the anchored
+        patterns (see the anchored parameter of match()).
+
+        :param dir_prefix: Path of the directory from the filesystem top, starting
+                           and ending with '/'
+        """
+        return self.index.anchored_prefixes.related(dir_prefix)
+
+    def include_possible(self, dir_prefix: str, before: int):
+        """Whether an include rule numbered below before can match below dir_prefix"""
+        if self.lowest_suffix_include is not None:
+            if self.lowest_suffix_include < before:
+                return True
+        return any(
+            number < before
+            and (prefix.startswith(dir_prefix) or dir_prefix.startswith(prefix))
+            for number, prefix in self.anchored_includes
+        )
+
+    def children_excluded(self, pathstr: str, anchored: bool = True):
+        """
+        Check whether all entries of a directory are excluded (by a pattern PAT/*)
+
+        The directory then does not need to be listed at all.
+
+        :param pathstr: Path of the directory from the filesystem top
+        :param anchored: See match()
+        :return: The excluding pattern (without a leading '/') or None
+        """
+        number = self.children_index.match(pathstr, anchored)
+        if number is None or self.include_possible(pathstr + '/', number):
+            return None
+        return self.display_pattern(number)
+
+
+@functools.lru_cache(maxsize=32)
+def get_matcher(patterns: tuple, relative_fs_top=False, filter_rules: tuple = ()):
+    """
+    The ExclusionMatcher for a configuration
+
+    Compiled once per distinct configuration and shared by all callers.
+
+    :param patterns: Tuple of the exclusion patterns
+    :param relative_fs_top: See ExclusionMatcher
+    :param filter_rules: Tuple of FilterRules
+    """
+    return ExclusionMatcher(
+        patterns, relative_fs_top=relative_fs_top, filter_rules=filter_rules
+    )
+
+
+class PatternStats:
+    """Counters of one exclusion pattern"""
+
+    __slots__ = ('matches', 'entries', 'dirs', 'bytes', 'seconds')
+
+    def __init__(self):
+        self.matches = 0
+        # What is pruned below the matched paths (including themselves)
+        self.entries = 0
+        self.dirs = 0
+        self.bytes = 0
+        # Time of the exclusion checks decided by the pattern
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ExclusionStats:
+    """
+    Per-pattern hit counters and the volume pruned by each pattern
+
+    The patterns are checked together (see RuleIndex), so the time of a check
+    is counted for the pattern which decided it; checks without a match are
+    counted separately.
+    """
+
+    def __init__(self, patterns=()):
+        """
+        :param patterns: The patterns to report (even if they never match)
+        """
+        self.patterns = {pat: PatternStats() for pat in patterns}
+        self.unmatched_checks = 0
+        self.unmatched_seconds = 0.0
+
+    def record_check(self, pat, seconds: float):
+        """Count an exclusion check which was decided by pat (None: no match)"""
+        if pat is None:
+            self.unmatched_checks += 1
+            self.unmatched_seconds += seconds
+            return
+        stats = self.patterns.get(pat)
+        if stats is None:
+            stats = self.patterns[pat] = PatternStats()
+        stats.matches += 1
+        stats.seconds += seconds
+
+    def record_pruned(self, pat, volume):
+        """Add the volume (a scanner.TreeVolume) pruned by pat"""
+        stats = self.patterns[pat]
+        stats.entries += volume.entries
+        stats.dirs += volume.dirs
+        stats.bytes += volume.bytes
+
+    def sorted_patterns(self):
+        """(pattern, PatternStats) pairs, the most pruning patterns first"""
+        return sorted(
+            self.patterns.items(),
+            key=lambda item: (-item[1].bytes, -item[1].entries, -item[1].matches),
+        )
+
+    def as_dict(self):
+        """The statistics as dict (for a JSON report)"""
+        return {
+            'patterns': [
+                dict(pattern=pat, **stats.as_dict())
+                for pat, stats in self.sorted_patterns()
+            ],
+            'unmatched': {
+                'checks': self.unmatched_checks,
+                'seconds': self.unmatched_seconds,
+            },
+        }
+
+    def report_text(self):
+        """The statistics as table"""
+        lines = [
+            f"{'matches':>9} {'entries':>10} {'dirs':>9} {'bytes':>15} "
+            f"{'time [ms]':>10}  pattern"
+        ]
+        for pat, stats in self.sorted_patterns():
+            lines.append(
+                f"{stats.matches:9} {stats.entries:10} {stats.dirs:9} "
+                f"{stats.bytes:15} {stats.seconds * 1e3:10.1f}  {pat}"
+            )
+        lines.append(
+            f"{self.unmatched_checks:9} {'':10} {'':9} {'':15} "
+            f"{self.unmatched_seconds * 1e3:10.1f}  (no match)"
+        )
+        return '\n'.join(lines)
+
 
 if __name__ == '__main__':
     for p in STANDARD_EXCLUDE_PATTERNS:
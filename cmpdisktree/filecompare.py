@@ -0,0 +1,784 @@
+"""
+File content comparison for the compare phase
+
+Replaces filecmp.cmp (which reads 8 KiB chunks into new bytes objects): The
+contents are read with readinto into preallocated buffers, which are reused for
+all files (one buffer pair per thread), and compared without copying.
+
+Files above a size threshold are split into byte ranges, which are compared
+at the same time by a pool of range threads (with positioned reads on shared
+file descriptors). The first mismatch in any range cancels the others.
+
+The mmap engine maps both files instead and compares them window by window
+directly in the mapped pages (no read buffers at all). Small files and files
+which cannot be mapped (special files, some FUSE filesystems) are read as
+usual.
+
+Sparse files are compared by their data regions (found with SEEK_DATA and
+SEEK_HOLE): Ranges which are holes in both files are skipped, a data range
+facing a hole only has to be all zeros.
+
+With the drop cache policy the compared chunks are dropped from the page
+cache right after their compare (posix_fadvise, F_NOCACHE on macOS), so a
+compare of a large tree doesn't push everything else out of memory.
+
+The direct engine reads around the page cache altogether (O_DIRECT, F_NOCACHE
+on macOS), so that the compare verifies what is on the media. O_DIRECT needs
+aligned buffers, which are allocated with mmap.
+
+Small files (the size known from the traversal) take a short cut: each side
+is read with a single os.read on a raw file descriptor and the two results
+compared directly.
+"""
+import bisect
+import errno
+import fcntl
+import mmap
+import os
+import stat
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+MIB = 1024 * 1024
+DEFAULT_CHUNK_SIZE = 4 * MIB
+# Reads start with this size and double up to the chunk size, so a difference
+# near the start of a large file is found without reading a full chunk
+START_CHUNK_SIZE = 1 * MIB
+# Files up to this size are read in one go (see ContentComparer.cmp_small)
+DEFAULT_SMALL_FILE_SIZE = 16 * 1024
+# Threads comparing the byte ranges of large files (see ContentComparer)
+DEFAULT_RANGE_WORKERS = 4
+# Reads into the buffers without a copy (os.pread returns new bytes)
+HAVE_PREADV = hasattr(os, 'preadv')
+
+READINTO_ENGINE = 'readinto'
+MMAP_ENGINE = 'mmap'
+DIRECT_ENGINE = 'direct'
+COMPARE_ENGINES = (READINTO_ENGINE, MMAP_ENGINE, DIRECT_ENGINE)
+# Smaller files are read even with the mmap engine (mapping costs more than
+# the copy into the buffers saves)
+MMAP_MIN_SIZE = 256 * 1024
+
+SPARSE_SUPPORTED = hasattr(os, 'SEEK_DATA') and hasattr(os, 'SEEK_HOLE')
+# Smaller files are not checked for holes (they are read in one or two reads)
+SPARSE_MIN_SIZE = 1 * MIB
+# Unit of st_blocks
+STAT_BLOCK_SIZE = 512
+
+CACHE_KEEP = 'keep'
+CACHE_DROP = 'drop'
+CACHE_POLICIES = (CACHE_KEEP, CACHE_DROP)
+# posix_fadvise hints (None where not available, e.g. on macOS)
+POSIX_FADV_SEQUENTIAL = getattr(os, 'POSIX_FADV_SEQUENTIAL', None)
+POSIX_FADV_WILLNEED = getattr(os, 'POSIX_FADV_WILLNEED', None)
+POSIX_FADV_DONTNEED = getattr(os, 'POSIX_FADV_DONTNEED', None)
+# macOS: Reads of a file with F_NOCACHE set bypass the cache (if possible)
+F_NOCACHE = getattr(fcntl, 'F_NOCACHE', None)
+O_DIRECT = getattr(os, 'O_DIRECT', None)
+DIRECT_IO_SUPPORTED = O_DIRECT is not None or F_NOCACHE is not None
+
+
+def stat_signature(st: os.stat_result):
+    """The signature filecmp uses for shallow compares: (type, size, mtime)"""
+    return (stat.S_IFMT(st.st_mode), st.st_size, st.st_mtime)
+
+
+def path_signature(path):
+    """
+    The stat signature of path (None if it cannot be stat'ed)
+
+    Symlinks to directories get the signature of the directory (as Path.is_dir()
+    follows symlinks), all other symlinks the signature of the symlink itself.
+    """
+    try:
+        st = os.lstat(path)
+        if stat.S_ISLNK(st.st_mode):
+            try:
+                target_st = os.stat(path)
+                if stat.S_ISDIR(target_st.st_mode):
+                    st = target_st
+            except OSError:
+                pass
+    except OSError:
+        return None
+    return stat_signature(st)
+
+
+class CompareItem(NamedTuple):
+    """
+    An entry to compare in the compare phase
+
+    The signatures (see stat_signature) are what the traversal already knows
+    about the two sides, None if not known.
+    """
+
+    path1: Path
+    path2: Path
+    sig1: Optional[Tuple] = None
+    sig2: Optional[Tuple] = None
+
+
+def readinto_full(f, view: memoryview):
+    """
+    Fill view from the file f
+
+    :return: Number of bytes read (less than len(view) only at the end of file)
+    """
+    total = 0
+    size = len(view)
+    while total < size:
+        num = f.readinto(view[total:])
+        if not num:
+            break
+        total += num
+    return total
+
+
+def pread_full(fd, view: memoryview, offset: int):
+    """
+    Fill view from the file descriptor fd starting at offset (see readinto_full)
+
+    Doesn't use or change the file position, so several threads can read
+    from the same fd.
+    """
+    total = 0
+    size = len(view)
+    while total < size:
+        if HAVE_PREADV:
+            num = os.preadv(fd, [view[total:]], offset + total)
+        else:
+            data = os.pread(fd, size - total, offset + total)
+            num = len(data)
+            view[total : total + num] = data
+        if not num:
+            break
+        total += num
+    return total
+
+
+def fadvise(fd, offset: int, length: int, advice):
+    """
+    posix_fadvise() if the advice is available (length 0: up to the end)
+
+    Only a hint, so errors are ignored.
+    """
+    if advice is None:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def start_uncached(fd, length: int):
+    """
+    Prepare the open file fd for a sequential read without caching
+
+    :param length: Size of the first read (which is asked for right away)
+    """
+    if POSIX_FADV_SEQUENTIAL is not None:
+        fadvise(fd, 0, 0, POSIX_FADV_SEQUENTIAL)
+        fadvise(fd, 0, length, POSIX_FADV_WILLNEED)
+    elif F_NOCACHE is not None:
+        try:
+            fcntl.fcntl(fd, F_NOCACHE, 1)
+        except OSError:
+            pass
+
+
+def open_direct(path):
+    """
+    Open path for reading around the page cache
+
+    :return: The file descriptor or None if the file (or its filesystem) doesn't
+             support it
+    """
+    try:
+        if O_DIRECT is not None:
+            return os.open(path, os.O_RDONLY | O_DIRECT)
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as err:
+        if err.errno == errno.EINVAL:
+            return None
+        raise
+    try:
+        fcntl.fcntl(fd, F_NOCACHE, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def pread_direct(fd, view: memoryview, offset: int):
+    """
+    Read up to len(view) bytes at offset of the O_DIRECT file fd into view
+
+    Only one read: After a short read the next position may no longer be
+    aligned (see stop_direct()).
+
+    :return: Number of bytes read
+    """
+    if HAVE_PREADV:
+        return os.preadv(fd, [view], offset)
+    data = os.pread(fd, len(view), offset)
+    view[: len(data)] = data
+    return len(data)
+
+
+def stop_direct(fd):
+    """Let the open_direct() file fd read through the page cache again"""
+    # F_NOCACHE doesn't need aligned reads, so it can stay
+    if O_DIRECT is not None:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~O_DIRECT)
+
+
+def data_regions(fd, size: int):
+    """
+    The data regions of the file fd (everything else is holes)
+
+    Changes the file position of fd.
+
+    :return: List of (start, end) offsets, None if the filesystem cannot tell
+    """
+    regions = []
+    pos = 0
+    try:
+        while pos < size:
+            try:
+                start = os.lseek(fd, pos, os.SEEK_DATA)
+            except OSError as err:
+                if err.errno == errno.ENXIO:
+                    # Only a hole after pos
+                    break
+                raise
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            regions.append((start, end))
+            pos = end
+    except OSError:
+        return None
+    return regions
+
+
+def region_parts(regions1, regions2, size: int):
+    """
+    Split the range up to size at the bounds of the data regions of two files
+
+    :return: Generator of (start, end, data1, data2), data1/data2 tell whether
+             the part is data (or a hole) in file 1/file 2
+    """
+    starts1 = [start for start, _ in regions1]
+    starts2 = [start for start, _ in regions2]
+
+    def is_data(regions, starts, pos):
+        i = bisect.bisect_right(starts, pos) - 1
+        return i >= 0 and pos < regions[i][1]
+
+    bounds = sorted({0, size, *(b for r in regions1 + regions2 for b in r)})
+    for start, end in zip(bounds, bounds[1:]):
+        if start < size:
+            yield (
+                start,
+                min(end, size),
+                is_data(regions1, starts1, start),
+                is_data(regions2, starts2, start),
+            )
+
+
+class ContentComparer:
+    """Compare files byte by byte with reusable read buffers"""
+
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        scheduler=None,
+        large_file_size: Optional[int] = None,
+        range_workers: int = DEFAULT_RANGE_WORKERS,
+        engine: str = READINTO_ENGINE,
+        sparse: bool = True,
+        cache_policy: str = CACHE_KEEP,
+        small_file_size: int = DEFAULT_SMALL_FILE_SIZE,
+    ):
+        """
+        :param chunk_size: Maximal number of bytes read per file in one go
+                           (and size of the read buffers)
+        :param scheduler: devices.DeviceScheduler doing the reads (FS1 and FS2 at
+                          the same time), None: read in the calling thread
+        :param large_file_size: Files of this size (in bytes) and above are
+                                compared in byte ranges at the same time
+                                (None: never)
+        :param range_workers: Number of threads comparing the byte ranges (and
+                              number of ranges per large file)
+        :param engine: READINTO_ENGINE: read into the buffers, MMAP_ENGINE:
+                       compare the memory-mapped files (the reads are page
+                       faults in the calling thread, scheduler doesn't apply),
+                       DIRECT_ENGINE: read around the page cache into aligned
+                       buffers (in the calling thread as well)
+        :param sparse: Compare sparse files by their data regions only
+        :param cache_policy: CACHE_KEEP: leave the page cache to the OS,
+                             CACHE_DROP: drop the compared chunks from it
+        :param small_file_size: Files up to this size (in bytes) are read in a
+                                single read without file objects (0: never;
+                                not with a scheduler or the direct engine)
+        """
+        self.chunk_size = chunk_size
+        self.scheduler = scheduler
+        self.large_file_size = large_file_size
+        self.range_workers = range_workers
+        self.engine = engine
+        self.sparse = sparse and SPARSE_SUPPORTED
+        self.drop_cache = cache_policy == CACHE_DROP
+        if scheduler is not None or engine == DIRECT_ENGINE:
+            small_file_size = 0
+        self.small_file_size = small_file_size
+        # Zeros to compare data against holes (allocated on first use)
+        self.zeros = None
+        self.local = threading.local()
+        # Shared by all large files (started on first use)
+        self.range_pool = None
+        self.range_pool_lock = threading.Lock()
+
+    def buffers(self):
+        """The read buffers of the calling thread (allocated on first use)"""
+        try:
+            return self.local.buffers
+        except AttributeError:
+            self.local.buffers = (
+                bytearray(self.chunk_size),
+                bytearray(self.chunk_size),
+            )
+            return self.local.buffers
+
+    def direct_buffers(self):
+        """The aligned read buffers of the calling thread for the direct engine"""
+        try:
+            return self.local.direct_buffers
+        except AttributeError:
+            # Anonymous maps are page aligned (as O_DIRECT needs it)
+            self.local.direct_buffers = (
+                mmap.mmap(-1, self.chunk_size),
+                mmap.mmap(-1, self.chunk_size),
+            )
+            return self.local.direct_buffers
+
+    def is_small(self, sig):
+        """Whether a file with the stat signature sig takes the small file path"""
+        return (
+            sig is not None
+            and sig[0] == stat.S_IFREG
+            and 0 < sig[1] <= self.small_file_size
+        )
+
+    def is_large(self, size: int):
+        """Whether a file of size bytes is compared in byte ranges"""
+        return self.large_file_size is not None and size >= self.large_file_size
+
+    def cmp(
+        self,
+        path1,
+        path2,
+        shallow: bool = False,
+        sig1=None,
+        sig2=None,
+        progress=None,
+    ):
+        """
+        Compare two files (same semantics as filecmp.cmp without its cache)
+
+        :param shallow: Files with the same type, size and mtime are taken as equal
+        :param sig1: Known stat signature of path1 (saves a stat call)
+        :param sig2: Known stat signature of path2 (saves a stat call)
+        :param progress: Called with the number of bytes compared after each
+                         chunk of a large file (see is_large) or each part of
+                         a sparse file
+        :return: True if the files are equal
+        """
+        if sig1 is None:
+            sig1 = stat_signature(os.stat(path1))
+        if sig2 is None:
+            sig2 = stat_signature(os.stat(path2))
+        if sig1[0] != stat.S_IFREG or sig2[0] != stat.S_IFREG:
+            return False
+        if shallow and sig1 == sig2:
+            return True
+        if sig1[1] != sig2[1]:
+            return False
+
+        size = sig1[1]
+        if self.is_small(sig1):
+            res = self.cmp_small(path1, path2, size)
+            if res is not None:
+                return res
+        if self.engine == DIRECT_ENGINE:
+            res = self.cmp_direct(path1, path2, size, progress)
+            if res is not None:
+                return res
+        with open(path1, 'rb', buffering=0) as f1, open(path2, 'rb', buffering=0) as f2:
+            if not self.drop_cache:
+                return self.cmp_open(f1, f2, size, progress)
+            first_chunk = min(START_CHUNK_SIZE, self.chunk_size)
+            start_uncached(f1.fileno(), first_chunk)
+            start_uncached(f2.fileno(), first_chunk)
+            try:
+                return self.cmp_open(f1, f2, size, progress)
+            finally:
+                # Including what was asked for in advance but not compared
+                fadvise(f1.fileno(), 0, 0, POSIX_FADV_DONTNEED)
+                fadvise(f2.fileno(), 0, 0, POSIX_FADV_DONTNEED)
+
+    def cmp_small(self, path1, path2, size: int):
+        """
+        Compare two small files of size bytes, each read with one os.read
+
+        :return: True if the contents are equal, None if a read was short (let
+                 the general compare find out why)
+        """
+        # One byte more than expected: tells a file which has grown since
+        data1 = self.read_small(path1, size + 1)
+        data2 = self.read_small(path2, size + 1)
+        if len(data1) != size or len(data2) != size:
+            return None
+        return data1 == data2
+
+    def read_small(self, path, length: int):
+        """Read up to length bytes of the file path in a single read"""
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            data = os.read(fd, length)
+            if self.drop_cache:
+                fadvise(fd, 0, 0, POSIX_FADV_DONTNEED)
+            return data
+        finally:
+            os.close(fd)
+
+    def cmp_direct(self, path1, path2, size: int, progress=None):
+        """
+        Compare two files of size bytes reading around the page cache
+
+        :param progress: See cmp()
+        :return: True if the contents are equal, None if a file cannot be read
+                 that way
+        """
+        fd1 = open_direct(path1)
+        if fd1 is None:
+            return None
+        try:
+            fd2 = open_direct(path2)
+            if fd2 is None:
+                return None
+            try:
+                return self.cmp_direct_fds(fd1, fd2, size, progress)
+            finally:
+                os.close(fd2)
+        finally:
+            os.close(fd1)
+
+    def cmp_direct_fds(self, fd1, fd2, size: int, progress=None):
+        """
+        Compare two files of size bytes opened with open_direct()
+
+        The files are read up to their end (as cmp_content() does), so a file
+        which has grown since its size was taken is a difference. A read can
+        come back short anywhere in the file (network and FUSE filesystems,
+        signals), not only at its end. If that leaves the position unaligned,
+        the rest is read through the page cache.
+
+        :param progress: See cmp()
+        :return: True if the contents are equal, None if the alignment is
+                 rejected
+        """
+        buf1, buf2 = self.direct_buffers()
+        direct = True
+        offset = 0
+        with memoryview(buf1) as view1, memoryview(buf2) as view2:
+            while True:
+                try:
+                    if direct:
+                        num1 = pread_direct(fd1, view1, offset)
+                        num2 = pread_direct(fd2, view2, offset)
+                    else:
+                        num1, num2 = self.read_chunks(fd1, fd2, view1, view2, offset)
+                except OSError as err:
+                    # Rejected alignment: let the normal compare do it
+                    if offset == 0 and err.errno == errno.EINVAL:
+                        return None
+                    raise
+                if num1 == num2 == 0:
+                    # Shorter than its size: changed while comparing
+                    return offset >= size
+                num = min(num1, num2)
+                if num == 0:
+                    return False
+                # A find() as long as the searched range is a compare in place
+                if buf1.find(view2[:num], 0, num) != 0:
+                    return False
+                offset += num
+                if progress is not None:
+                    progress(num)
+                if direct and offset % mmap.PAGESIZE:
+                    stop_direct(fd1)
+                    stop_direct(fd2)
+                    direct = False
+
+    def cmp_open(self, f1, f2, size: int, progress=None):
+        """
+        Compare the contents of two open files of the same size
+
+        :param f1, f2: Unbuffered binary files at position 0
+        :param progress: See cmp()
+        """
+        if self.sparse and size >= SPARSE_MIN_SIZE:
+            res = self.cmp_sparse(f1.fileno(), f2.fileno(), size, progress)
+            if res is not None:
+                return res
+        if self.is_large(size):
+            return self.cmp_ranges(f1.fileno(), f2.fileno(), size, progress)
+        if self.engine == MMAP_ENGINE and size >= MMAP_MIN_SIZE:
+            res = self.cmp_mmap(f1, f2)
+            if res is not None:
+                return res
+        return self.cmp_content(f1, f2)
+
+    def cmp_sparse(self, fd1, fd2, size: int, progress=None):
+        """
+        Compare two files of size bytes by their data regions
+
+        Fewer blocks than the size need is only a hint: compressed files
+        (APFS, btrfs, ZFS) have them as well, but no holes.
+
+        :param progress: See cmp()
+        :return: True if the contents are equal, None if neither file has a
+                 hole (or the filesystem doesn't tell the holes)
+        """
+        st1 = os.fstat(fd1)
+        st2 = os.fstat(fd2)
+        if (
+            st1.st_blocks * STAT_BLOCK_SIZE >= size
+            and st2.st_blocks * STAT_BLOCK_SIZE >= size
+        ):
+            return None
+        try:
+            regions1 = data_regions(fd1, size)
+            regions2 = data_regions(fd2, size)
+        finally:
+            # The fallback reads from the file positions
+            os.lseek(fd1, 0, os.SEEK_SET)
+            os.lseek(fd2, 0, os.SEEK_SET)
+        if regions1 is None or regions2 is None:
+            return None
+        if regions1 == regions2 == [(0, size)]:
+            return None
+
+        if self.zeros is None:
+            self.zeros = memoryview(bytes(self.chunk_size))
+        buf1, buf2 = self.buffers()
+        with memoryview(buf1) as view1, memoryview(buf2) as view2:
+            for start, end, data1, data2 in region_parts(regions1, regions2, size):
+                if data1 or data2:
+                    for offset in range(start, end, self.chunk_size):
+                        chunk = min(self.chunk_size, end - offset)
+                        if not self.cmp_chunk_at(
+                            fd1 if data1 else None,
+                            fd2 if data2 else None,
+                            view1[:chunk],
+                            view2[:chunk],
+                            offset,
+                        ):
+                            return False
+                        self.chunk_done(
+                            fd1 if data1 else None,
+                            fd2 if data2 else None,
+                            offset,
+                            chunk,
+                        )
+                        if progress is not None:
+                            progress(chunk)
+                elif progress is not None:
+                    # A hole in both files
+                    progress(end - start)
+        return True
+
+    def cmp_chunk_at(self, fd1, fd2, view1: memoryview, view2: memoryview, offset):
+        """
+        Compare the chunk at offset of two files, where a fd of None is a hole
+
+        :return: True if the chunks are equal
+        """
+        chunk = len(view1)
+        buf1, buf2 = self.buffers()
+        if fd1 is not None and fd2 is not None:
+            num1, num2 = self.read_chunks(fd1, fd2, view1, view2, offset)
+            return num1 == num2 == chunk and buf1.startswith(view2)
+        # Data facing a hole: Equal if it's all zeros
+        if fd1 is not None:
+            fd, buf, view = fd1, buf1, view1
+        else:
+            fd, buf, view = fd2, buf2, view2
+        return pread_full(fd, view, offset) == chunk and buf.startswith(
+            self.zeros[:chunk]
+        )
+
+    @staticmethod
+    def drop_window(map1, map2, start: int, length: int):
+        """Unmap a compared window of both maps (so the cache can drop it)"""
+        if hasattr(mmap, 'MADV_DONTNEED'):
+            map1.madvise(mmap.MADV_DONTNEED, start, length)
+            map2.madvise(mmap.MADV_DONTNEED, start, length)
+
+    def cmp_mmap(self, f1, f2):
+        """
+        Compare the contents of two files by memory-mapping them
+
+        :return: True if the contents are equal, None if a file cannot be mapped
+        """
+        try:
+            map1 = mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        with map1:
+            try:
+                map2 = mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+            with map2:
+                size = len(map1)
+                if size != len(map2):
+                    return False
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    map1.madvise(mmap.MADV_SEQUENTIAL)
+                    map2.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(map2) as view2:
+                    for start in range(0, size, self.chunk_size):
+                        end = min(start + self.chunk_size, size)
+                        # A find() for a window of map2 which is exactly as long
+                        # as the searched range of map1 is a compare in place
+                        # (slicing the mmaps would copy)
+                        if map1.find(view2[start:end], start, end) != start:
+                            return False
+                        if self.drop_cache:
+                            self.drop_window(map1, map2, start, end - start)
+                            self.chunk_done(
+                                f1.fileno(), f2.fileno(), start, end - start
+                            )
+                return True
+
+    def cmp_content(self, f1, f2):
+        """Compare the (remaining) content of two unbuffered binary files"""
+        buf1, buf2 = self.buffers()
+        with memoryview(buf1) as view1, memoryview(buf2) as view2:
+            chunk = min(START_CHUNK_SIZE, self.chunk_size)
+            offset = 0
+            while True:
+                num1, num2 = self.read_chunks(f1, f2, view1[:chunk], view2[:chunk])
+                if num1 != num2:
+                    return False
+                if num1 == 0:
+                    return True
+                # bytearray.startswith() is a plain memcmp against the slice
+                # (comparing two memoryviews would go item by item)
+                if not buf1.startswith(view2[:num1]):
+                    return False
+                if num1 < chunk:
+                    return True
+                next_chunk = min(chunk * 2, self.chunk_size)
+                self.chunk_done(f1.fileno(), f2.fileno(), offset, num1, next_chunk)
+                offset += num1
+                chunk = next_chunk
+
+    def chunk_done(self, fd1, fd2, offset: int, length: int, ahead: int = 0):
+        """
+        With the drop cache policy: Drop a compared chunk from the page cache
+
+        :param fd1, fd2: The files of the chunk (None: a hole, nothing to drop)
+        :param ahead: Number of bytes after the chunk to read in the background
+        """
+        if not self.drop_cache:
+            return
+        for fd in (fd1, fd2):
+            if fd is not None:
+                fadvise(fd, offset, length, POSIX_FADV_DONTNEED)
+                if ahead > 0:
+                    fadvise(fd, offset + length, ahead, POSIX_FADV_WILLNEED)
+
+    def cmp_ranges(self, fd1, fd2, size: int, progress=None):
+        """
+        Compare the first size bytes of two files in byte ranges at the same time
+
+        :param progress: See cmp()
+        :return: True if the contents are equal
+        """
+        with self.range_pool_lock:
+            if self.range_pool is None:
+                self.range_pool = ThreadPoolExecutor(
+                    max_workers=self.range_workers, thread_name_prefix='range'
+                )
+        # Ranges of whole chunks, one per range thread
+        num_chunks = -(-size // self.chunk_size)
+        chunks_per_range = -(-num_chunks // self.range_workers)
+        range_size = chunks_per_range * self.chunk_size
+        mismatch = threading.Event()
+        progress_lock = threading.Lock()
+
+        def cmp_range(start):
+            end = min(start + range_size, size)
+            buf1, buf2 = self.buffers()
+            with memoryview(buf1) as view1, memoryview(buf2) as view2:
+                for offset in range(start, end, self.chunk_size):
+                    if mismatch.is_set():
+                        return
+                    chunk = min(self.chunk_size, end - offset)
+                    num1, num2 = self.read_chunks(
+                        fd1, fd2, view1[:chunk], view2[:chunk], offset
+                    )
+                    if num1 != chunk or num2 != chunk:
+                        # Shorter than its size: changed while comparing
+                        mismatch.set()
+                        return
+                    if not buf1.startswith(view2[:chunk]):
+                        mismatch.set()
+                        return
+                    ahead = min(self.chunk_size, end - offset - chunk)
+                    self.chunk_done(fd1, fd2, offset, chunk, ahead)
+                    if progress is not None:
+                        with progress_lock:
+                            progress(chunk)
+
+        futures = [
+            self.range_pool.submit(cmp_range, start)
+            for start in range(0, size, range_size)
+        ]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        # Let the others stop at their next chunk before raising
+        for future in done:
+            if future.exception() is not None:
+                mismatch.set()
+        wait(futures)
+        for future in futures:
+            future.result()
+        return not mismatch.is_set()
+
+    def read_chunks(self, f1, f2, view1: memoryview, view2: memoryview, offset=None):
+        """
+        Fill view1 from f1 and view2 from f2 (see readinto_full)
+
+        :param offset: None: read from the file positions of the file objects f1
+                       and f2, else: read from this offset of the fds f1 and f2
+                       (see pread_full)
+        """
+        if self.scheduler is None:
+            if offset is None:
+                return readinto_full(f1, view1), readinto_full(f2, view2)
+            return pread_full(f1, view1, offset), pread_full(f2, view2, offset)
+        future1 = self.scheduler.reader1.submit(f1, view1, offset)
+        future2 = self.scheduler.reader2.submit(f2, view2, offset)
+        # Both reads have to be finished before the buffers are used again
+        wait((future1, future2))
+        return future1.result(), future2.result()
+
+    def close(self):
+        """Stop the range threads (if started)"""
+        if self.range_pool is not None:
+            self.range_pool.shutdown()
+            self.range_pool = None
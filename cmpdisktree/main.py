@@ -8,7 +8,7 @@ import sys
 
 import click
 
-from cmpdisktree import comparer, utils, __version__
+from cmpdisktree import comparer, filecompare, readorder, utils, __version__
 
 
 class ExpandedPath(click.Path):
@@ -58,6 +58,15 @@ Errors are reported to a file (default '{utils.ERR_LOG_DEFAULT_NAME}')
     is_flag=True,
     help="Add exclusions for live filesystems (e.g. boot volumes)"
 )
+@click.option(
+    '--exclude-from',
+    type=ExpandedPath(exists=True, dir_okay=False),
+    multiple=True,
+    metavar='FILE',
+    help="Read exclude/include rules from FILE: '- PAT' or '+ PAT' (a subset "
+         "of the rsync filter syntax), PAT matching as the standard exclusions. "
+         "Can be given several times",
+)
 @click.option(
     '-m',
     '--ignore-missing-in-FS1',
@@ -71,6 +80,133 @@ Errors are reported to a file (default '{utils.ERR_LOG_DEFAULT_NAME}')
     is_flag=True,
     help="Allow relative filesystem top (used when applying the exclusions)",
 )
+@click.option(
+    '--traverse-workers',
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of threads listing directories in the traversal phase",
+)
+@click.option(
+    '--compare-workers',
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of threads comparing file contents in the compare phase",
+)
+@click.option(
+    '--fs1-device-workers',
+    type=click.IntRange(min=1),
+    default=None,
+    help="Read the files of FS1 with its own thread pool of this size (default: "
+         "--compare-workers, if --fs2-device-workers is given)",
+)
+@click.option(
+    '--fs2-device-workers',
+    type=click.IntRange(min=1),
+    default=None,
+    help="Read the files of FS2 with its own thread pool of this size. If FS1 "
+         "and FS2 are on the same device they share one pool",
+)
+@click.option(
+    '--compare-chunk-size',
+    type=click.IntRange(min=1, max=256),
+    default=4,
+    show_default=True,
+    metavar='MIB',
+    help="Maximal size of the reads when comparing file contents (in MiB)",
+)
+@click.option(
+    '--compare-engine',
+    type=click.Choice(filecompare.COMPARE_ENGINES),
+    default=filecompare.READINTO_ENGINE,
+    show_default=True,
+    help="Read the file contents into buffers, compare the memory-mapped files "
+         "or read around the page cache with direct I/O (both fall back to "
+         "reading for files which don't support it)",
+)
+@click.option(
+    '--cache-policy',
+    type=click.Choice(filecompare.CACHE_POLICIES),
+    default=filecompare.CACHE_KEEP,
+    show_default=True,
+    help="Leave the page cache to the OS or drop the file contents from it as "
+         "soon as they are compared (keeps the memory of other programs cached)",
+)
+@click.option(
+    '--prefetch',
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    metavar='N',
+    help="Start reading the next N files in the background while comparing "
+         "(hides the latency of slow or network disks)",
+)
+@click.option(
+    '--small-file-size',
+    type=click.IntRange(min=0),
+    default=filecompare.DEFAULT_SMALL_FILE_SIZE // 1024,
+    show_default=True,
+    metavar='KIB',
+    help="Files up to this size are read in one go and compared in batches "
+         "(in KiB, 0: off)",
+)
+@click.option(
+    '--large-file-size',
+    type=click.IntRange(min=1),
+    default=None,
+    metavar='MIB',
+    help="Compare files of this size and above in byte ranges at the same time "
+         "(in MiB, default: never)",
+)
+@click.option(
+    '--range-workers',
+    type=click.IntRange(min=1),
+    default=filecompare.DEFAULT_RANGE_WORKERS,
+    show_default=True,
+    help="Number of threads comparing the byte ranges of a large file",
+)
+@click.option(
+    '--spill-threshold',
+    type=click.IntRange(min=1),
+    default=None,
+    metavar='MIB',
+    help="Memory for the list of files to compare above which it is moved to a "
+         "temporary file (in MiB, default: keep in memory)",
+)
+@click.option(
+    '--read-order',
+    type=click.Choice(readorder.READ_ORDERS),
+    default=readorder.DISCOVERY,
+    show_default=True,
+    help="Order of the content reads: as found, by inode number or by physical "
+         "offset of the files in FS2 (for rotational disks)",
+)
+@click.option(
+    '--pipeline',
+    is_flag=True,
+    help="Compare file contents while still traversing (overlap phase 1 and 2)",
+)
+@click.option(
+    '--dir-fds',
+    is_flag=True,
+    help="Keep directories open while traversing and access their entries "
+         "relative to them (saves path lookups in deep trees)",
+)
+@click.option(
+    '--split-scan',
+    is_flag=True,
+    help="List FS1 and FS2 with separate threads, so the slower disk sets the "
+         "pace (each with --traverse-workers threads)",
+)
+@click.option(
+    '--exclusion-report',
+    type=click.Choice(['text', 'json']),
+    default=None,
+    help="Write per-pattern exclusion statistics (matches, pruned entries and "
+         f"bytes, time) to '{utils.EXCL_REPORT_DEFAULT_NAMES['text']}' (text) or "
+         f"'{utils.EXCL_REPORT_DEFAULT_NAMES['json']}' (json)",
+)
 @click.option(
     '-o', '--output-path', type=ExpandedPath(), help="Output path for report file."
 )
@@ -0,0 +1,106 @@
+"""
+Read-ahead of the upcoming files in the compare phase
+
+The compare of a small file is mostly waiting: for the open and the first
+read on both devices. The Prefetcher runs some entries ahead of the compare
+and asks the OS to start reading the beginning of those files (or reads it
+in the background), so this latency overlaps the compare of the files before.
+"""
+import collections
+import os
+import stat
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cmpdisktree.filecompare import (
+    POSIX_FADV_WILLNEED,
+    START_CHUNK_SIZE,
+    CompareItem,
+    fadvise,
+)
+
+# Maximal number of threads doing the read-ahead
+MAX_PREFETCH_WORKERS = 8
+
+
+def prefetch_file(path, length: int):
+    """Get the first length bytes of the file path into the page cache"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        if POSIX_FADV_WILLNEED is not None:
+            fadvise(fd, 0, length, POSIX_FADV_WILLNEED)
+        else:
+            os.pread(fd, length, 0)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def needs_content(item: CompareItem):
+    """Whether the compare of item will (probably) read the file contents"""
+    if item.sig1 is not None and item.sig1[0] != stat.S_IFREG:
+        return False
+    if item.sig1 is not None and item.sig2 is not None:
+        return item.sig1[1] == item.sig2[1] and item.sig1[1] > 0
+    return True
+
+
+class Prefetcher:
+    """
+    Iterate over CompareItems while prefetching the next ones
+
+    Iterating is not thread-safe (as for the iterator it wraps).
+    """
+
+    def __init__(self, items, depth: int, length: int = START_CHUNK_SIZE):
+        """
+        :param items: The CompareItems (an iterable)
+        :param depth: Number of items to prefetch ahead of the current one
+        :param length: Number of bytes to prefetch from the start of each file
+        """
+        self.items = items
+        self.depth = depth
+        self.length = length
+        # Number of items handed out (prefetches behind it are skipped)
+        self.position = 0
+        self.lock = threading.Lock()
+        self.num_prefetched = 0
+
+    def prefetch(self, index: int, item: CompareItem):
+        """Prefetch both files of item, the index-th item (if still ahead)"""
+        with self.lock:
+            if index < self.position:
+                return
+            self.num_prefetched += 1
+        prefetch_file(item.path1, self.length)
+        prefetch_file(item.path2, self.length)
+
+    def __iter__(self):
+        ahead = collections.deque()
+        workers = min(self.depth, MAX_PREFETCH_WORKERS)
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='prefetch'
+        ) as pool:
+            try:
+                for index, item in enumerate(self.items):
+                    if needs_content(item):
+                        pool.submit(self.prefetch, index, item)
+                    ahead.append(item)
+                    if len(ahead) > self.depth:
+                        yield self.next_ahead(ahead)
+                while ahead:
+                    yield self.next_ahead(ahead)
+            finally:
+                # Skip the prefetches still queued (if stopped early)
+                with self.lock:
+                    self.position = sys.maxsize
+
+    def next_ahead(self, ahead: collections.deque):
+        with self.lock:
+            self.position += 1
+        return ahead.popleft()
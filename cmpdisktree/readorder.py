@@ -0,0 +1,101 @@
+"""
+Order of the content reads in the compare phase
+
+On rotational disks the read order decides how much the heads have to seek.
+The traversal finds the files in name order, which has little to do with
+where their data lies on the disk. Sorting the files to compare by inode
+number (which roughly follows the allocation order) or by the physical
+offset of their first extent turns most seeks into short forward steps.
+
+The keys are taken from FS2 (the backup volume, usually the rotational one).
+"""
+import fcntl
+import os
+import struct
+import sys
+from typing import Optional
+
+DISCOVERY = 'discovery'
+INODE = 'inode'
+EXTENT = 'extent'
+READ_ORDERS = (DISCOVERY, INODE, EXTENT)
+
+# Linux: ioctl FS_IOC_FIEMAP with struct fiemap and room for one fiemap_extent
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQQQI12x')
+# Extent flags which mean the physical offset is not (yet) known
+FIEMAP_EXTENT_UNKNOWN = 0x2
+FIEMAP_EXTENT_DELALLOC = 0x4
+# macOS: fcntl F_LOG2PHYS with struct log2phys (packed to 4 bytes)
+F_LOG2PHYS = 49
+LOG2PHYS = struct.Struct('=Iqq')
+
+
+def fiemap_offset(fd) -> Optional[int]:
+    """Physical offset of the first extent of the open file fd (Linux)"""
+    buf = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(buf, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    fcntl.ioctl(fd, FS_IOC_FIEMAP, buf, True)
+    mapped_extents = FIEMAP_HEADER.unpack_from(buf)[3]
+    if mapped_extents == 0:
+        return None
+    _, physical, _, _, _, flags = FIEMAP_EXTENT.unpack_from(buf, FIEMAP_HEADER.size)
+    if flags & (FIEMAP_EXTENT_UNKNOWN | FIEMAP_EXTENT_DELALLOC):
+        return None
+    return physical
+
+
+def log2phys_offset(fd) -> Optional[int]:
+    """Device offset of the start of the open file fd (macOS)"""
+    result = fcntl.fcntl(fd, F_LOG2PHYS, LOG2PHYS.pack(0, 0, 0))
+    return LOG2PHYS.unpack(result)[2]
+
+
+def physical_offset(path) -> Optional[int]:
+    """
+    Physical offset of the first data block of the file path
+
+    :return: The offset in bytes or None if it is not known (empty files, data
+             not yet written, filesystems or platforms without the query)
+    """
+    if sys.platform.startswith('linux'):
+        query = fiemap_offset
+    elif sys.platform == 'darwin':
+        query = log2phys_offset
+    else:
+        return None
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return query(fd)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def inode_number(path, inode=0) -> int:
+    """The inode number of path (inode if already known, 0 if it cannot be found)"""
+    if inode:
+        return inode
+    try:
+        return os.lstat(path).st_ino
+    except OSError:
+        return 0
+
+
+def order_key(read_order: str, path, inode=0):
+    """
+    Sort key of the file path for the read order
+
+    Files without known physical offset come after the others (in inode order).
+
+    :param inode: The inode number of path if already known (0: not known)
+    """
+    if read_order == INODE:
+        return inode_number(path, inode)
+    offset = physical_offset(path)
+    return (offset is None, offset or 0, inode_number(path, inode))
@@ -0,0 +1,210 @@
+"""
+Directory listing engine for the traversal phase
+
+Built on os.scandir, so that the file type information the OS returns with each
+directory entry is kept (in the DirEntry objects) and no extra lstat calls are
+needed to tell files, directories and symlinks apart.
+"""
+import errno
+import os
+import stat
+from typing import List, NamedTuple, Tuple
+
+# Whether directories can be listed through open file descriptors and their
+# entries accessed relative to them (see scan_dir_at)
+DIR_FDS_SUPPORTED = (
+    os.open in os.supports_dir_fd
+    and os.scandir in os.supports_fd
+    and os.stat in os.supports_dir_fd
+    and os.readlink in os.supports_dir_fd
+)
+OPEN_DIR_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
+# Errors which mean "does not exist" for exists() (as for Path.exists())
+NOT_EXISTING_ERRNOS = (errno.ENOENT, errno.ENOTDIR, errno.EBADF, errno.ELOOP)
+
+
+class DirListing(NamedTuple):
+    """
+    The entries of one directory level
+
+    Split up like os.walk does it: `dirs` holds everything which is a directory
+    (including symlinks pointing to directories), `files` holds everything else.
+    """
+
+    dirs: List[os.DirEntry]
+    files: List[os.DirEntry]
+
+
+def scan_dir(path, onerror=None):
+    """
+    List one directory level
+
+    :param path: Directory to list (or the file descriptor of an open directory)
+    :param onerror: Called with the OSError if the directory cannot be listed
+                    (same semantics as the onerror parameter of os.walk)
+    :return: A DirListing or None if the directory cannot be listed
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as err:
+        if onerror is not None:
+            onerror(err)
+        return None
+
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            # Only symlinks (and filesystems without d_type) need a stat here
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            dirs.append(entry)
+        else:
+            files.append(entry)
+    return DirListing(dirs, files)
+
+
+def scan_dir_at(path, dir_fd=None, onerror=None):
+    """
+    Open a directory and list it through the file descriptor
+
+    The entries of such a listing access the directory through the descriptor
+    (their `path` is just the name), so it has to stay open while they are used.
+
+    :param path: Directory to list (relative to dir_fd if given)
+    :param dir_fd: File descriptor of an open directory or None
+    :param onerror: See scan_dir()
+    :return: tuple of the open file descriptor and the DirListing
+             or (None, None) if the directory cannot be opened or listed
+    """
+    try:
+        fd = os.open(path, OPEN_DIR_FLAGS, dir_fd=dir_fd)
+    except OSError as err:
+        if onerror is not None:
+            onerror(err)
+        return None, None
+    listing = scan_dir(fd, onerror=onerror)
+    if listing is None:
+        os.close(fd)
+        return None, None
+    return fd, listing
+
+
+def exists(path, dir_fd=None):
+    """Whether path exists (following symlinks), as Path.exists() but with dir_fd"""
+    try:
+        os.stat(path, dir_fd=dir_fd)
+    except OSError as err:
+        if err.errno in NOT_EXISTING_ERRNOS:
+            return False
+        raise
+    return True
+
+
+class TreeVolume(NamedTuple):
+    """What a directory tree holds"""
+
+    entries: int
+    dirs: int
+    bytes: int
+
+
+def tree_volume(path, children_only: bool = False):
+    """
+    Count the entries, directories and bytes of a tree (symlinks are not followed)
+
+    Entries which cannot be accessed are skipped. The count stays on the device
+    of path (as `du -x`): directories on other devices (mount points) are
+    counted, but not what is below them.
+
+    :param path: Top of the tree (can be a file or symlink as well)
+    :param children_only: Count only what is below path, not path itself
+    :return: TreeVolume
+    """
+    entries = dirs = size = 0
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return TreeVolume(0, 0, 0)
+    device = st.st_dev
+    stack = []
+    if children_only:
+        stack.append(path)
+    else:
+        entries += 1
+        if stat.S_ISDIR(st.st_mode):
+            dirs += 1
+            stack.append(path)
+        else:
+            size += st.st_size
+
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    entries += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs += 1
+                            if os.lstat(entry.path).st_dev == device:
+                                stack.append(entry.path)
+                        else:
+                            size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+    return TreeVolume(entries, dirs, size)
+
+
+class JoinedEntries(NamedTuple):
+    """The result of matching the entries of two directory listings by name"""
+
+    only1: List[os.DirEntry]
+    only2: List[os.DirEntry]
+    both: List[Tuple[os.DirEntry, os.DirEntry]]
+
+
+def _entry_name(entry):
+    return entry.name
+
+
+def join_entries(entries1, entries2):
+    """
+    Match two entry lists by name (sorted merge-join)
+
+    Runs in O(n log n) for the sorting plus a single linear pass, regardless of
+    how many entries are only in one of the lists.
+
+    :param entries1: Entries (anything with a `name` attribute) from FS1
+    :param entries2: Entries from FS2
+    :return: JoinedEntries, each bucket sorted by name
+    """
+    sorted1 = sorted(entries1, key=_entry_name)
+    sorted2 = sorted(entries2, key=_entry_name)
+    only1 = []
+    only2 = []
+    both = []
+
+    i = j = 0
+    len1 = len(sorted1)
+    len2 = len(sorted2)
+    while i < len1 and j < len2:
+        entry1 = sorted1[i]
+        entry2 = sorted2[j]
+        if entry1.name == entry2.name:
+            both.append((entry1, entry2))
+            i += 1
+            j += 1
+        elif entry1.name < entry2.name:
+            only1.append(entry1)
+            i += 1
+        else:
+            only2.append(entry2)
+            j += 1
+    only1.extend(sorted1[i:])
+    only2.extend(sorted2[j:])
+    return JoinedEntries(only1, only2, both)
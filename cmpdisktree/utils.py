@@ -4,6 +4,7 @@ General utility classes for cmpdisktree
 import os
 import pwd
 import subprocess
+import threading
 import time
 from enum import Enum, auto
 from pathlib import Path
@@ -54,6 +55,10 @@ class ErrorKind(Enum):
 
 ERR_LOG_DEFAULT_NAME = 'cmp-err.log'
 OK_LOG_DEFAULT_NAME = 'cmp-ok.log'
+EXCL_REPORT_DEFAULT_NAMES = {
+    'text': 'cmp-exclusions.log',
+    'json': 'cmp-exclusions.json',
+}
 LOG_BACKUP_EXT = '.bak'
 
 
@@ -64,6 +69,7 @@ class LogFile:
     Features:
     - File is ONLY created when first written to
     - Possible old file (from previous run) is ALWAYS move to *.bak
+    - Can be written to from several threads
     """
 
     def __init__(self, pathstr: str, default_name: str, force_default: bool):
@@ -93,6 +99,7 @@ class LogFile:
                 self.fpath = path
 
         self.fobject = None
+        self.lock = threading.Lock()
         if self.fpath.is_file():
             self.fpath.rename(self.fpath.with_name(self.fpath.name + LOG_BACKUP_EXT))
 
@@ -103,10 +110,11 @@ class LogFile:
             self.fobject = None
 
     def write(self, txt: str):
-        if not self.fobject:
-            self.fobject = open(self.fpath, 'a')
-        print(txt, file=self.fobject)
-        self.close_if_needed()
+        with self.lock:
+            if not self.fobject:
+                self.fobject = open(self.fpath, 'a')
+            print(txt, file=self.fobject)
+            self.close_if_needed()
 
 
 def get_terminal_size():
@@ -192,6 +200,21 @@ class Display(tqdm):
             time.sleep(0.5)
         self.flush_buffer()
 
+    def byte_bar(self, desc, total):
+        """An extra progress bar (below this one) in bytes for a single file"""
+        return tqdm(
+            desc=desc,
+            total=total,
+            unit='B',
+            unit_scale=True,
+            unit_divisor=1024,
+            leave=False,
+            ascii=True,
+            ncols=None if self.disable else self.ncols,
+            smoothing=0,
+            disable=self.disable,
+        )
+
     def echo(self, msg):
         """Buffer output if progress bar is running """
         if self.disable:
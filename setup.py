@@ -15,7 +15,7 @@ import re
 from setuptools import find_packages, setup
 
 DEPENDENCIES = ['click','tqdm']
-EXCLUDE_FROM_PACKAGES = ['contrib', 'docs', 'tests*']
+EXCLUDE_FROM_PACKAGES = ['contrib', 'docs', 'tests*', 'benchmarks*']
 CURDIR = os.path.abspath(os.path.dirname(__file__))
 
 with io.open(os.path.join(CURDIR, 'README.md'), 'r', encoding='utf-8') as f:
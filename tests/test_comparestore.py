@@ -0,0 +1,88 @@
+"""
+Test for the compact store of the files to compare in comparestore.py
+"""
+
+import stat
+from pathlib import Path
+
+from cmpdisktree.comparestore import CompareStore
+from cmpdisktree.filecompare import CompareItem
+
+FS1 = Path('top/fs1')
+FS2 = Path('other/fs2')
+
+
+def item(rel, sig1=None, sig2=None):
+    return CompareItem(FS1 / rel, FS2 / rel, sig1, sig2)
+
+
+class TestCompareStore:
+    def test_roundtrip(self):
+        items = [
+            item('file-at-top.txt', (stat.S_IFREG, 3, 1.5), (stat.S_IFREG, 4, 2.5)),
+            item('dir/ümlaut and space.txt', (stat.S_IFREG, 0, 0.0), None),
+            item('dir/sub/deep', None, None),
+            item('dir/again.txt', (stat.S_IFLNK, 10, 1e9), None),
+        ]
+        store = CompareStore(FS1, FS2)
+        for i in items:
+            store.append(i)
+
+        assert len(store) == len(items)
+        assert list(store) == items
+        # Iterating twice gives the same
+        assert list(store) == items
+
+    def test_top(self):
+        items = [item('.'), item('a.txt')]
+        store = CompareStore(FS1, FS2)
+        for i in items:
+            store.append(i)
+        assert list(store) == items
+
+    def test_dirs_stored_once(self):
+        store = CompareStore(FS1, FS2)
+        for name in ['a', 'b', 'c']:
+            store.append(item(f'dir/{name}'))
+        store.append(item('other/x'))
+        store.append(item('dir/d'))
+        assert store.segment.dirs == ['dir', 'other']
+
+    def test_empty(self):
+        store = CompareStore(FS1, FS2)
+        assert len(store) == 0
+        assert list(store) == []
+
+    def test_spill(self, tmp_path):
+        items = [
+            item(f'dir-{i // 10}/file-{i}', (stat.S_IFREG, i, 0.0)) for i in range(100)
+        ]
+        store = CompareStore(FS1, FS2, spill_threshold=500, spill_dir=tmp_path)
+        for i in items:
+            store.append(i)
+
+        assert store.num_spilled > 0
+        assert len(store.segment) < len(items)
+        assert len(store) == len(items)
+        assert list(store) == items
+        store.close()
+
+    def test_read_order_inode(self):
+        store = CompareStore(FS1, FS2, read_order='inode')
+        for name, inode in [('c', 30), ('a', 10), ('b', 20)]:
+            store.append_entry('dir', name, inode2=inode)
+        assert [i.path1.name for i in store] == ['a', 'b', 'c']
+
+    def test_read_order_spilled_segments(self, tmp_path):
+        store = CompareStore(
+            FS1, FS2, spill_threshold=1000, spill_dir=tmp_path, read_order='inode'
+        )
+        for i in range(40):
+            store.append_entry('dir', f'file-{i}', inode2=1000 - i)
+
+        assert store.num_spilled > 0
+        names = [i.path1.name for i in store]
+        assert sorted(names) == sorted(f'file-{i}' for i in range(40))
+        # Reversed within each segment
+        assert names != [f'file-{i}' for i in range(40)]
+        store.close()
@@ -0,0 +1,62 @@
+"""
+Test for the per-device read scheduling in devices.py
+"""
+
+import os
+
+import pytest
+
+from cmpdisktree import devices, filecompare
+
+
+@pytest.fixture()
+def scheduler(tmp_path):
+    fs1 = tmp_path.joinpath('fs1')
+    fs2 = tmp_path.joinpath('fs2')
+    fs1.mkdir()
+    fs2.mkdir()
+    scheduler = devices.DeviceScheduler(fs1, fs2, 4, 2)
+    yield scheduler
+    scheduler.shutdown()
+
+
+class TestDeviceScheduler:
+    def test_same_device_shares_pool(self, scheduler):
+        assert scheduler.reader1 is scheduler.reader2
+        assert len(scheduler.stats()) == 1
+        assert scheduler.stats()[0]['limit'] == 2
+        assert scheduler.stats()[0]['name'] == 'FS1+FS2'
+
+    def test_compare_through_scheduler(self, tmp_path, scheduler):
+        content = os.urandom(10000)
+        changed = bytearray(content)
+        changed[9000] ^= 0xFF
+        path1 = tmp_path.joinpath('fs1', 'file')
+        path2 = tmp_path.joinpath('fs2', 'file')
+        path3 = tmp_path.joinpath('fs2', 'changed')
+        path1.write_bytes(content)
+        path2.write_bytes(content)
+        path3.write_bytes(changed)
+
+        comparer = filecompare.ContentComparer(chunk_size=4096, scheduler=scheduler)
+        assert comparer.cmp(path1, path2)
+        assert not comparer.cmp(path1, path3)
+
+        stats = scheduler.stats()[0]
+        assert stats['reads'] > 0
+        assert stats['bytes'] > 2 * len(content)
+        assert stats['max_pending'] >= 1
+
+    def test_large_file_ranges_through_scheduler(self, tmp_path, scheduler):
+        content = os.urandom(10000)
+        path1 = tmp_path.joinpath('fs1', 'large')
+        path2 = tmp_path.joinpath('fs2', 'large')
+        path1.write_bytes(content)
+        path2.write_bytes(content)
+
+        comparer = filecompare.ContentComparer(
+            chunk_size=1000, scheduler=scheduler, large_file_size=2000
+        )
+        assert comparer.cmp(path1, path2)
+        comparer.close()
+        assert scheduler.stats()[0]['bytes'] == 2 * len(content)
@@ -0,0 +1,238 @@
+"""
+Test for the exclusion matching in exclusions.py
+"""
+
+import pytest
+
+from cmpdisktree import comparer, exclusions
+from cmpdisktree.exclusions import (
+    ADD_LIVEFS_EXCLUDE_PATTERNS,
+    STANDARD_EXCLUDE_PATTERNS,
+    ExclusionMatcher,
+    ExclusionStats,
+    FilterRule,
+    get_matcher,
+    parse_filter_line,
+    read_filter_file,
+)
+from cmpdisktree.scanner import TreeVolume
+
+PATTERNS = STANDARD_EXCLUDE_PATTERNS + ADD_LIVEFS_EXCLUDE_PATTERNS
+
+
+class TestExclusionMatcher:
+    @pytest.mark.parametrize(
+        'pathstr, pat',
+        [
+            ('/.journal', '.journal'),  # anchored literal
+            ('/Volumes/Backup', 'Volumes/*'),  # anchored glob
+            ('/Users/me/.Trash', '.Trash'),  # basename literal
+            ('/Users/me/Library/Caches', 'Library/Caches'),  # suffix literal
+            ('/Users/me/._resource', '._*'),  # glob at the end
+            ('/Users/me/Library/Mobile Documents/x', 'Library/Mobile Documents/*'),
+            ('/private/var/folders/ab/cd/T', 'private/var/folders/*/*/T'),
+        ],
+    )
+    def test_match(self, pathstr, pat):
+        assert ExclusionMatcher(PATTERNS).match(pathstr) == pat
+
+    @pytest.mark.parametrize(
+        'pathstr',
+        [
+            '/.',
+            '/Users/me/.journal',  # anchored only at the top
+            '/Users/me/Trash',
+            '/Users/me/Library/CachesNot',
+            '/Volumes',
+        ],
+    )
+    def test_no_match(self, pathstr):
+        assert ExclusionMatcher(PATTERNS).match(pathstr) is None
+
+    def test_relative_fs_top(self):
+        matcher = ExclusionMatcher(PATTERNS, relative_fs_top=True)
+        assert matcher.match('/deeper/.journal') == '.journal'
+        assert matcher.match('/deeper/Volumes/Backup') == 'Volumes/*'
+
+    def test_no_patterns(self):
+        assert ExclusionMatcher([]).match('/anything') is None
+
+    def test_first_listed_pattern(self, tmp_path):
+        matcher = ExclusionMatcher(['._*', '._thumb'])
+        assert matcher.match('/a/._thumb') in ('._*', '._thumb')
+        assert matcher.match('/a/._thumb', first=True) == '._*'
+
+        rules_file = tmp_path.joinpath('rules.txt')
+        rules_file.write_text('- ._*\n- ._thumb\n')
+        cmp = comparer.Comparer(
+            tmp_path,
+            tmp_path,
+            clear_std_exclusions=True,
+            exclude_from=[rules_file],
+            exclusion_report='text',
+            output_path=tmp_path,
+        )
+        assert cmp.excluded_pathstr('/a/._thumb')
+        assert cmp.exclusion_stats.patterns['._*'].matches == 1
+        assert cmp.exclusion_stats.patterns['._thumb'].matches == 0
+
+
+class TestExclusionPruning:
+    def test_anchored_possible(self):
+        matcher = ExclusionMatcher(PATTERNS)
+        assert matcher.anchored_possible('/')
+        assert matcher.anchored_possible('/private/')
+        assert matcher.anchored_possible('/private/var/folders/ab/')
+        assert not matcher.anchored_possible('/Users/')
+        assert not matcher.anchored_possible('/Users/me/Library/')
+        # With a relative top nothing is anchored
+        assert not ExclusionMatcher(PATTERNS, relative_fs_top=True).anchored_possible('/')
+
+    def test_children_excluded(self):
+        matcher = ExclusionMatcher(PATTERNS)
+        assert matcher.children_excluded('/Volumes') == 'Volumes/*'
+        assert matcher.children_excluded('/private/var/vm') == 'private/var/vm/*'
+        assert (
+            matcher.children_excluded('/Users/me/Library/Mobile Documents')
+            == 'Library/Mobile Documents/*'
+        )
+        assert matcher.children_excluded('/Users/me/Volumes') is None
+        assert matcher.children_excluded('/private/var') is None
+
+
+class TestFilterRules:
+    @pytest.mark.parametrize(
+        'line, rule',
+        [
+            ('.DS_Store\n', FilterRule(False, '.DS_Store')),
+            ('- /Volumes/*', FilterRule(False, '/Volumes/*')),
+            ('exclude *.tmp', FilterRule(False, '*.tmp')),
+            ('+ /Volumes/Data', FilterRule(True, '/Volumes/Data')),
+            ('include Caches', FilterRule(True, 'Caches')),
+            ('- Photos Library', FilterRule(False, 'Photos Library')),
+            ('Photos Library', FilterRule(False, 'Photos Library')),
+            ('# comment', None),
+            ('; comment', None),
+            ('\n', None),
+        ],
+    )
+    def test_parse_line(self, line, rule):
+        assert parse_filter_line(line) == rule
+
+    @pytest.mark.parametrize(
+        'line',
+        [
+            'H *.tmp',
+            'P foo',
+            'R keep',
+            'merge /etc/rules',
+            'dir-merge .rules',
+            '-! bar',
+            '+/ foo',
+            '-,! x',
+        ],
+    )
+    def test_other_rules_not_supported(self, line):
+        with pytest.raises(ValueError, match='Unsupported filter rule'):
+            parse_filter_line(line)
+
+    @pytest.mark.parametrize('line', ['cache/', '- /Volumes/Data/', '+ Caches/'])
+    def test_dirs_only_not_supported(self, line):
+        with pytest.raises(ValueError, match='directories only'):
+            parse_filter_line(line)
+
+    def test_clear_not_supported(self, tmp_path):
+        fpath = tmp_path.joinpath('rules.txt')
+        fpath.write_text('*.tmp\n!\n')
+        with pytest.raises(ValueError, match='line 2'):
+            read_filter_file(fpath)
+
+    def test_read_file(self, tmp_path):
+        fpath = tmp_path.joinpath('rules.txt')
+        fpath.write_text('# my rules\n+ keep.tmp\n*.tmp\n')
+        assert read_filter_file(fpath) == [
+            FilterRule(True, 'keep.tmp'),
+            FilterRule(False, '*.tmp'),
+        ]
+
+    def test_first_match_wins(self):
+        rules = [
+            FilterRule(True, '/Volumes/Data'),
+            FilterRule(False, '*.tmp'),
+            FilterRule(True, 'keep*'),
+        ]
+        matcher = ExclusionMatcher(PATTERNS, filter_rules=rules)
+        assert matcher.match('/Volumes/Data') is None
+        assert matcher.match('/Volumes/Backup') == 'Volumes/*'
+        assert matcher.match('/Users/me/keep.tmp') == '*.tmp'
+        assert matcher.match('/Users/me/keep.txt') is None
+        # Later rules and the standard patterns still apply
+        assert matcher.match('/Users/me/.Trash') == '.Trash'
+
+    def test_include_prevents_pruning(self):
+        rules = [FilterRule(True, '/Volumes/Data')]
+        matcher = ExclusionMatcher(PATTERNS, filter_rules=rules)
+        assert matcher.children_excluded('/Volumes') is None
+        assert matcher.children_excluded('/private/var/vm') == 'private/var/vm/*'
+
+    def test_many_rules(self):
+        rules = [FilterRule(False, f'/data/dir{i}/*.log') for i in range(10000)]
+        rules += [FilterRule(False, f'name{i}') for i in range(10000)]
+        matcher = ExclusionMatcher([], filter_rules=rules)
+        assert matcher.match('/data/dir9999/x.log') == 'data/dir9999/*.log'
+        assert matcher.match('/data/dir9999/x.txt') is None
+        assert matcher.match('/a/b/name5000') == 'name5000'
+        assert not matcher.anchored_possible('/Users/')
+
+
+class TestExclusionStats:
+    def test_counters(self):
+        stats = ExclusionStats(['.Trash', 'Volumes/*'])
+        stats.record_check('Volumes/*', 0.5)
+        stats.record_pruned('Volumes/*', TreeVolume(10, 2, 1000))
+        stats.record_check('Volumes/*', 0.25)
+        stats.record_check(None, 1.0)
+
+        result = stats.as_dict()
+        assert result['patterns'][0] == {
+            'pattern': 'Volumes/*',
+            'matches': 2,
+            'entries': 10,
+            'dirs': 2,
+            'bytes': 1000,
+            'seconds': 0.75,
+        }
+        assert result['patterns'][1]['pattern'] == '.Trash'
+        assert result['patterns'][1]['matches'] == 0
+        assert result['unmatched'] == {'checks': 1, 'seconds': 1.0}
+        assert 'Volumes/*' in stats.report_text().splitlines()[1]
+
+    def test_excluding_patterns(self):
+        rules = [FilterRule(True, 'keep'), FilterRule(False, '/Volumes/*')]
+        matcher = ExclusionMatcher(['.Trash', 'Volumes/*'], filter_rules=rules)
+        assert matcher.excluding_patterns() == ['Volumes/*', '.Trash']
+
+
+class TestSharedMatchers:
+    def test_cached_per_configuration(self):
+        assert get_matcher(PATTERNS) is get_matcher(PATTERNS)
+        assert get_matcher(PATTERNS) is not get_matcher(PATTERNS, True)
+        rules = (FilterRule(True, 'keep'),)
+        assert get_matcher(PATTERNS, False, rules) is get_matcher(
+            PATTERNS, False, rules
+        )
+
+    def test_comparers_leave_patterns_alone(self, tmp_path):
+        # A copy (tuple() would return the same object) of what the module holds
+        std_patterns = list(exclusions.STANDARD_EXCLUDE_PATTERNS)
+        matchers = [
+            comparer.Comparer(
+                tmp_path, tmp_path, live_fs_exclusions=True, output_path=tmp_path
+            ).exclude_matcher
+            for _ in range(3)
+        ]
+        assert list(exclusions.STANDARD_EXCLUDE_PATTERNS) == std_patterns
+        assert matchers[0] is matchers[1] is matchers[2]
+        assert matchers[0].patterns == PATTERNS
+        plain = comparer.Comparer(tmp_path, tmp_path, output_path=tmp_path)
+        assert list(plain.exclude_matcher.patterns) == std_patterns
@@ -0,0 +1,430 @@
+"""
+Test for the file content comparison in filecompare.py
+"""
+
+import errno
+import os
+import stat
+
+import pytest
+
+from cmpdisktree import filecompare
+
+
+@pytest.fixture()
+def content():
+    return os.urandom(10000)
+
+
+def write_pair(tmp_path, content1, content2):
+    path1 = tmp_path.joinpath('file1')
+    path2 = tmp_path.joinpath('file2')
+    path1.write_bytes(content1)
+    path2.write_bytes(content2)
+    return path1, path2
+
+
+def changed_at(content, pos):
+    changed = bytearray(content)
+    changed[pos] ^= 0xFF
+    return bytes(changed)
+
+
+# Small chunk sizes, so that the tests cross chunk boundaries (and no small
+# file path, so that the test files are read in chunks)
+@pytest.fixture(params=[1000, 4096, filecompare.DEFAULT_CHUNK_SIZE])
+def comparer(request):
+    return filecompare.ContentComparer(chunk_size=request.param, small_file_size=0)
+
+
+class TestContentComparer:
+    def test_same(self, tmp_path, comparer, content):
+        assert comparer.cmp(*write_pair(tmp_path, content, content))
+
+    def test_empty(self, tmp_path, comparer):
+        assert comparer.cmp(*write_pair(tmp_path, b'', b''))
+
+    @pytest.mark.parametrize('pos', [0, 999, 1000, 4096, 9999])
+    def test_diff(self, tmp_path, comparer, content, pos):
+        changed = changed_at(content, pos)
+        assert not comparer.cmp(*write_pair(tmp_path, content, changed))
+
+    def test_diff_size(self, tmp_path, comparer, content):
+        assert not comparer.cmp(*write_pair(tmp_path, content, content[:-1]))
+
+    def test_dir_is_not_equal(self, tmp_path, comparer):
+        assert not comparer.cmp(tmp_path, tmp_path)
+
+    def test_shallow(self, tmp_path, comparer, content):
+        path1, path2 = write_pair(tmp_path, content, changed_at(content, 10))
+        os.utime(path2, ns=(path1.stat().st_atime_ns, path1.stat().st_mtime_ns))
+        assert comparer.cmp(path1, path2, shallow=True)
+        assert not comparer.cmp(path1, path2, shallow=False)
+
+    def test_known_signatures_skip_stat(self, tmp_path, comparer):
+        # Nonexisting paths: the sizes of the signatures decide without any I/O
+        sig1 = (stat.S_IFREG, 10, 0.0)
+        sig2 = (stat.S_IFREG, 11, 0.0)
+        path1 = tmp_path.joinpath('nope1')
+        path2 = tmp_path.joinpath('nope2')
+        assert not comparer.cmp(path1, path2, sig1=sig1, sig2=sig2)
+
+
+class TestPathSignature:
+    def test_kinds(self, tmp_path):
+        tmp_path.joinpath('dir').mkdir()
+        tmp_path.joinpath('file').write_bytes(b'12345')
+        tmp_path.joinpath('dir-link').symlink_to('dir')
+        tmp_path.joinpath('file-link').symlink_to('file')
+
+        assert filecompare.path_signature(tmp_path / 'dir')[0] == stat.S_IFDIR
+        assert filecompare.path_signature(tmp_path / 'file')[:2] == (stat.S_IFREG, 5)
+        assert filecompare.path_signature(tmp_path / 'dir-link')[0] == stat.S_IFDIR
+        assert filecompare.path_signature(tmp_path / 'file-link')[0] == stat.S_IFLNK
+        assert filecompare.path_signature(tmp_path / 'nope') is None
+
+
+@pytest.fixture(params=[1, 3])
+def range_comparer(request):
+    comparer = filecompare.ContentComparer(
+        chunk_size=1000,
+        large_file_size=2000,
+        range_workers=request.param,
+        small_file_size=0,
+    )
+    yield comparer
+    comparer.close()
+
+
+class TestLargeFiles:
+    def test_same(self, tmp_path, range_comparer, content):
+        progress = []
+        path1, path2 = write_pair(tmp_path, content, content)
+        assert range_comparer.cmp(path1, path2, progress=progress.append)
+        assert sum(progress) == len(content)
+
+    @pytest.mark.parametrize('pos', [0, 999, 1000, 4096, 9999])
+    def test_diff(self, tmp_path, range_comparer, content, pos):
+        changed = changed_at(content, pos)
+        assert not range_comparer.cmp(*write_pair(tmp_path, content, changed))
+
+    def test_small_file_not_split(self, tmp_path, range_comparer, content):
+        progress = []
+        path1, path2 = write_pair(tmp_path, content[:1999], content[:1999])
+        assert range_comparer.cmp(path1, path2, progress=progress.append)
+        assert progress == []
+
+    def test_stops_at_mismatch(self, tmp_path, content):
+        comparer = filecompare.ContentComparer(
+            chunk_size=1000, large_file_size=2000, range_workers=1, small_file_size=0
+        )
+        progress = []
+        path1, path2 = write_pair(tmp_path, content, changed_at(content, 1500))
+        assert not comparer.cmp(path1, path2, progress=progress.append)
+        assert sum(progress) == 1000
+        comparer.close()
+
+
+class TestPreadFull:
+    def test_offsets(self, tmp_path, content):
+        path = tmp_path.joinpath('file')
+        path.write_bytes(content)
+        buf = bytearray(3000)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            assert filecompare.pread_full(fd, memoryview(buf), 9000) == 1000
+            assert bytes(buf[:1000]) == content[9000:]
+            assert filecompare.pread_full(fd, memoryview(buf), 10) == 3000
+            assert bytes(buf) == content[10:3010]
+        finally:
+            os.close(fd)
+
+
+@pytest.fixture()
+def mmap_comparer(monkeypatch):
+    # Map even the small test files
+    monkeypatch.setattr(filecompare, 'MMAP_MIN_SIZE', 0)
+    return filecompare.ContentComparer(
+        chunk_size=1000, engine='mmap', small_file_size=0
+    )
+
+
+class TestMmapEngine:
+    def test_same(self, tmp_path, mmap_comparer, content):
+        assert mmap_comparer.cmp(*write_pair(tmp_path, content, content))
+
+    @pytest.mark.parametrize('pos', [0, 999, 1000, 4096, 9999])
+    def test_diff(self, tmp_path, mmap_comparer, content, pos):
+        changed = changed_at(content, pos)
+        assert not mmap_comparer.cmp(*write_pair(tmp_path, content, changed))
+
+    def test_empty_falls_back(self, tmp_path, mmap_comparer):
+        path1, path2 = write_pair(tmp_path, b'', b'')
+        with open(path1, 'rb', buffering=0) as f1, open(path2, 'rb', buffering=0) as f2:
+            assert mmap_comparer.cmp_mmap(f1, f2) is None
+        assert mmap_comparer.cmp(path1, path2)
+
+
+def write_sparse(path, size, blocks):
+    """Create a file of size with the given {offset: bytes} and holes elsewhere"""
+    with open(path, 'wb') as f:
+        f.truncate(size)
+        for offset, data in blocks.items():
+            f.seek(offset)
+            f.write(data)
+    return path
+
+
+SPARSE_SIZE = 8 * filecompare.MIB
+DATA = os.urandom(100000)
+
+
+@pytest.fixture()
+def sparse_comparer():
+    return filecompare.ContentComparer(chunk_size=filecompare.MIB)
+
+
+@pytest.mark.skipif(not filecompare.SPARSE_SUPPORTED, reason="no SEEK_DATA")
+class TestSparseFiles:
+    def test_data_regions(self, tmp_path):
+        path = write_sparse(tmp_path / 'f', SPARSE_SIZE, {5 * filecompare.MIB: DATA})
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            regions = filecompare.data_regions(fd, SPARSE_SIZE)
+        finally:
+            os.close(fd)
+        # Without hole support the whole file is one data region
+        data_size = sum(end - start for start, end in regions)
+        assert len(DATA) <= data_size <= SPARSE_SIZE
+        assert regions[-1][1] >= 5 * filecompare.MIB + len(DATA)
+
+    def test_region_parts(self):
+        parts = list(filecompare.region_parts([(0, 10), (30, 40)], [(5, 35)], 50))
+        assert parts == [
+            (0, 5, True, False),
+            (5, 10, True, True),
+            (10, 30, False, True),
+            (30, 35, True, True),
+            (35, 40, True, False),
+            (40, 50, False, False),
+        ]
+
+    def test_same(self, tmp_path, sparse_comparer):
+        progress = []
+        blocks = {0: DATA, 3 * filecompare.MIB: DATA}
+        path1 = write_sparse(tmp_path / 'f1', SPARSE_SIZE, blocks)
+        path2 = write_sparse(tmp_path / 'f2', SPARSE_SIZE, blocks)
+        assert sparse_comparer.cmp(path1, path2, progress=progress.append)
+        assert sum(progress) in (0, SPARSE_SIZE)
+
+    def test_hole_equals_explicit_zeros(self, tmp_path, sparse_comparer):
+        path1 = write_sparse(tmp_path / 'f1', SPARSE_SIZE, {filecompare.MIB: DATA})
+        path2 = tmp_path / 'f2'
+        path2.write_bytes(path1.read_bytes())
+        assert sparse_comparer.cmp(path1, path2)
+        assert sparse_comparer.cmp(path2, path1)
+
+    @pytest.mark.parametrize('offset', [0, 4 * filecompare.MIB, SPARSE_SIZE - 1])
+    def test_data_in_hole(self, tmp_path, sparse_comparer, offset):
+        path1 = write_sparse(tmp_path / 'f1', SPARSE_SIZE, {})
+        path2 = write_sparse(tmp_path / 'f2', SPARSE_SIZE, {offset: b'x'})
+        assert not sparse_comparer.cmp(path1, path2)
+        assert not sparse_comparer.cmp(path2, path1)
+
+    def test_diff_in_data(self, tmp_path, sparse_comparer):
+        changed = changed_at(DATA, 5000)
+        path1 = write_sparse(tmp_path / 'f1', SPARSE_SIZE, {filecompare.MIB: DATA})
+        path2 = write_sparse(tmp_path / 'f2', SPARSE_SIZE, {filecompare.MIB: changed})
+        assert not sparse_comparer.cmp(path1, path2)
+
+
+    @pytest.mark.parametrize('engine', ['readinto', 'mmap'])
+    def test_compressed_not_sparse(self, tmp_path, monkeypatch, engine):
+        # Fully allocated files with fewer blocks (as compressed files have them)
+        fstat = os.fstat
+
+        def compressed_fstat(fd):
+            return os.stat_result(tuple(fstat(fd)), {'st_blocks': 1})
+
+        content = os.urandom(SPARSE_SIZE)
+        path1, path2 = write_pair(tmp_path, content, content)
+        comparer = filecompare.ContentComparer(
+            chunk_size=filecompare.MIB,
+            engine=engine,
+            large_file_size=None if engine == 'mmap' else SPARSE_SIZE,
+        )
+        calls = []
+
+        def record_calls(method):
+            orig = getattr(comparer, method)
+
+            def recording(*args, **kwargs):
+                calls.append(method)
+                return orig(*args, **kwargs)
+
+            monkeypatch.setattr(comparer, method, recording)
+
+        record_calls('cmp_ranges')
+        record_calls('cmp_mmap')
+        monkeypatch.setattr(os, 'fstat', compressed_fstat)
+        assert comparer.cmp(path1, path2)
+        assert calls == ['cmp_mmap' if engine == 'mmap' else 'cmp_ranges']
+        comparer.close()
+
+
+@pytest.fixture(params=['readinto', 'mmap'])
+def dropping_comparer(request, monkeypatch):
+    monkeypatch.setattr(filecompare, 'MMAP_MIN_SIZE', 0)
+    return filecompare.ContentComparer(
+        chunk_size=4096, engine=request.param, cache_policy='drop', small_file_size=0
+    )
+
+
+class TestDropCachePolicy:
+    def test_same_and_diff(self, tmp_path, dropping_comparer, content):
+        assert dropping_comparer.cmp(*write_pair(tmp_path, content, content))
+        changed = changed_at(content, 9999)
+        assert not dropping_comparer.cmp(*write_pair(tmp_path, content, changed))
+
+    @pytest.mark.skipif(
+        filecompare.POSIX_FADV_DONTNEED is None, reason="no posix_fadvise"
+    )
+    def test_chunks_dropped(self, tmp_path, dropping_comparer, content, monkeypatch):
+        advices = []
+        monkeypatch.setattr(
+            os, 'posix_fadvise', lambda fd, o, n, advice: advices.append((o, advice))
+        )
+        assert dropping_comparer.cmp(*write_pair(tmp_path, content, content))
+        dropped = {o for o, advice in advices if advice == os.POSIX_FADV_DONTNEED}
+        # Each compared chunk and finally the whole file (offset 0)
+        assert {0, 4096} <= dropped
+        assert (0, os.POSIX_FADV_SEQUENTIAL) in advices
+        # The first chunk is asked for before it is read
+        assert advices.index((0, os.POSIX_FADV_WILLNEED)) < advices.index(
+            (0, os.POSIX_FADV_DONTNEED)
+        )
+
+
+@pytest.fixture()
+def direct_comparer():
+    return filecompare.ContentComparer(chunk_size=4096, engine='direct')
+
+
+@pytest.mark.skipif(not filecompare.DIRECT_IO_SUPPORTED, reason="no direct I/O")
+class TestDirectEngine:
+    def test_same(self, tmp_path, direct_comparer, content):
+        assert direct_comparer.cmp(*write_pair(tmp_path, content, content))
+
+    def test_empty(self, tmp_path, direct_comparer):
+        assert direct_comparer.cmp(*write_pair(tmp_path, b'', b''))
+
+    @pytest.mark.parametrize('pos', [0, 4095, 4096, 9999])
+    def test_diff(self, tmp_path, direct_comparer, content, pos):
+        changed = changed_at(content, pos)
+        assert not direct_comparer.cmp(*write_pair(tmp_path, content, changed))
+
+    def test_fallback(self, tmp_path, direct_comparer, content, monkeypatch):
+        def rejecting_open(path, flags, *args, **kwargs):
+            raise OSError(errno.EINVAL, "O_DIRECT not supported")
+
+        path1, path2 = write_pair(tmp_path, content, changed_at(content, 10))
+        monkeypatch.setattr(os, 'open', rejecting_open)
+        assert filecompare.open_direct(path1) is None
+        assert not direct_comparer.cmp(path1, path2)
+
+
+def cmp_direct_fds(comparer, path1, path2, progress=None):
+    """ContentComparer.cmp_direct_fds() on fds opened without O_DIRECT"""
+    fd1 = os.open(path1, os.O_RDONLY)
+    fd2 = os.open(path2, os.O_RDONLY)
+    try:
+        size = os.fstat(fd1).st_size
+        return comparer.cmp_direct_fds(fd1, fd2, size, progress)
+    finally:
+        os.close(fd1)
+        os.close(fd2)
+
+
+class TestDirectReads:
+    def test_progress(self, tmp_path, direct_comparer, content):
+        progress = []
+        path1, path2 = write_pair(tmp_path, content, content)
+        assert cmp_direct_fds(direct_comparer, path1, path2, progress.append)
+        assert sum(progress) == len(content)
+
+    @pytest.mark.parametrize('short', [1000, 4096])
+    def test_short_read(self, tmp_path, direct_comparer, content, monkeypatch, short):
+        pread_direct = filecompare.pread_direct
+        calls = []
+
+        def short_pread_direct(fd, view, offset):
+            # The first read of the second file comes back short mid-file
+            calls.append(offset)
+            if len(calls) == 2:
+                return pread_direct(fd, view[:short], offset)
+            return pread_direct(fd, view, offset)
+
+        monkeypatch.setattr(filecompare, 'pread_direct', short_pread_direct)
+        progress = []
+        path1, path2 = write_pair(tmp_path, content, content)
+        assert cmp_direct_fds(direct_comparer, path1, path2, progress.append)
+        assert sum(progress) == len(content)
+
+        calls.clear()
+        path1, path2 = write_pair(tmp_path, content, changed_at(content, 9999))
+        assert not cmp_direct_fds(direct_comparer, path1, path2)
+
+    @pytest.mark.parametrize('added', [b'x', bytes(5000)])
+    def test_grown(self, tmp_path, direct_comparer, content, added):
+        path1, path2 = write_pair(tmp_path, content, content + added)
+        fd1 = os.open(path1, os.O_RDONLY)
+        fd2 = os.open(path2, os.O_RDONLY)
+        try:
+            # With the size from before the growth (as from the traversal)
+            assert not direct_comparer.cmp_direct_fds(fd1, fd2, len(content))
+        finally:
+            os.close(fd1)
+            os.close(fd2)
+
+    def test_shrunk(self, tmp_path, direct_comparer, content):
+        path1, path2 = write_pair(tmp_path, content, content)
+        fd1 = os.open(path1, os.O_RDONLY)
+        fd2 = os.open(path2, os.O_RDONLY)
+        try:
+            size = len(content) + 100
+            assert not direct_comparer.cmp_direct_fds(fd1, fd2, size)
+        finally:
+            os.close(fd1)
+            os.close(fd2)
+
+
+class TestSmallFiles:
+    def test_is_small(self):
+        comparer = filecompare.ContentComparer(small_file_size=100)
+        assert comparer.is_small((stat.S_IFREG, 100, 0.0))
+        assert not comparer.is_small((stat.S_IFREG, 101, 0.0))
+        assert not comparer.is_small((stat.S_IFREG, 0, 0.0))
+        assert not comparer.is_small((stat.S_IFLNK, 10, 0.0))
+        assert not comparer.is_small(None)
+        direct = filecompare.ContentComparer(engine='direct')
+        assert not direct.is_small((stat.S_IFREG, 100, 0.0))
+
+    @pytest.mark.parametrize('pos', [0, 5000, 9999])
+    def test_same_and_diff(self, tmp_path, content, pos):
+        comparer = filecompare.ContentComparer(small_file_size=len(content))
+        path1, path2 = write_pair(tmp_path, content, content)
+        assert comparer.cmp_small(path1, path2, len(content))
+        assert comparer.cmp(path1, path2)
+        path2.write_bytes(changed_at(content, pos))
+        assert not comparer.cmp_small(path1, path2, len(content))
+        assert not comparer.cmp(path1, path2)
+
+    def test_grown_files_fall_back(self, tmp_path, content):
+        # The signatures are from before the files have grown
+        comparer = filecompare.ContentComparer(small_file_size=len(content))
+        sig = (stat.S_IFREG, 100, 0.0)
+        path1, path2 = write_pair(tmp_path, content, content)
+        assert comparer.cmp_small(path1, path2, 100) is None
+        assert comparer.cmp(path1, path2, sig1=sig, sig2=sig)
+        path2.write_bytes(changed_at(content, 5000))
+        assert not comparer.cmp(path1, path2, sig1=sig, sig2=sig)
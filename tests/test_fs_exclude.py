@@ -2,9 +2,13 @@
 Test for the "filesystems in the `exclude` folder
 """
 
+import json
 from pathlib import Path
+from unittest import mock
 
-from tests.tutils import assert_swap_compare
+from cmpdisktree import scanner
+from cmpdisktree.utils import EXCL_REPORT_DEFAULT_NAMES
+from tests.tutils import assert_swap_compare, compare_in, num_of_err_lines
 
 DATA_PATH = Path('exclude')
 
@@ -122,3 +126,81 @@ class TestWithLiveExclude:
             'b-fs-top-here-added-DSstores',
             live_fs_exclusions=True,
         )
+
+
+class TestExcludeFrom:
+    @staticmethod
+    def make_fss(tmp_path):
+        for fs in ['fs1', 'fs2']:
+            tmp_path.joinpath(fs, 'dir').mkdir(parents=True)
+            tmp_path.joinpath(fs, 'file.txt').write_text('same')
+        tmp_path.joinpath('fs2', '.DS_Store').write_text('added')
+        tmp_path.joinpath('fs2', 'dir', '.DS_Store').write_text('added')
+
+    def test_added_DSstores(self, tmp_path):
+        self.make_fss(tmp_path)
+        rules = tmp_path.joinpath('rules.txt')
+        rules.write_text('# Finder files\n- .DS_Store\n')
+        assert compare_in(tmp_path, 'fs1', 'fs2', exclude_from=[rules])
+        assert not compare_in(tmp_path, 'fs1', 'fs2', clear_std_exclusions=True)
+
+    def test_include_before_live_exclusions(self, tmp_path):
+        self.make_fss(tmp_path)
+        rules = tmp_path.joinpath('rules.txt')
+        rules.write_text('+ /dir/.DS_Store\n')
+        assert compare_in(tmp_path, 'fs1', 'fs2', live_fs_exclusions=True)
+        assert not compare_in(
+            tmp_path, 'fs1', 'fs2', live_fs_exclusions=True, exclude_from=[rules]
+        )
+        assert num_of_err_lines(1) == 1
+
+
+class TestExclusionReport:
+    def test_json(self, tmp_path):
+        for fs in ['fs1', 'fs2']:
+            tmp_path.joinpath(fs, 'Volumes', 'Disk').mkdir(parents=True)
+            tmp_path.joinpath(fs, 'file.txt').write_text('same')
+        tmp_path.joinpath('fs1', 'Volumes', 'Disk', 'a.txt').write_text('12345')
+        tmp_path.joinpath('fs2', '.DS_Store').write_text('123')
+
+        assert compare_in(
+            tmp_path,
+            'fs1',
+            'fs2',
+            live_fs_exclusions=True,
+            exclusion_report='json',
+            output_path=tmp_path,
+        )
+        report = json.loads(
+            tmp_path.joinpath(EXCL_REPORT_DEFAULT_NAMES['json']).read_text()
+        )
+        patterns = {p['pattern']: p for p in report['patterns']}
+        assert patterns['Volumes/*']['matches'] == 1
+        assert patterns['Volumes/*']['entries'] == 2
+        assert patterns['Volumes/*']['dirs'] == 1
+        assert patterns['Volumes/*']['bytes'] == 5
+        assert patterns['.DS_Store']['matches'] == 1
+        assert patterns['.DS_Store']['bytes'] == 3
+        assert patterns['.Trash']['matches'] == 0
+        assert report['unmatched']['checks'] > 0
+
+
+class TestExcludedNotListed:
+    def test_volumes_not_listed(self, tmp_path):
+        for fs in ['fs1', 'fs2']:
+            tmp_path.joinpath(fs, 'Volumes', 'Disk').mkdir(parents=True)
+            tmp_path.joinpath(fs, 'Users', 'me').mkdir(parents=True)
+        tmp_path.joinpath('fs1', 'Volumes', 'Disk', 'only-in-1.txt').write_text('1')
+
+        listed = []
+        orig_scan_dir = scanner.scan_dir
+
+        def recording_scan_dir(path, onerror=None):
+            listed.append(path.relative_to(tmp_path).as_posix())
+            return orig_scan_dir(path, onerror)
+
+        with mock.patch.object(scanner, 'scan_dir', recording_scan_dir):
+            assert compare_in(tmp_path, 'fs1', 'fs2')
+        assert 'fs1/Volumes' not in listed
+        assert 'fs2/Volumes' not in listed
+        assert 'fs1/Users/me' in listed
@@ -3,8 +3,11 @@ Test for the "filesystems in the `basic` folder
 """
 
 from pathlib import Path
+from unittest import mock
 
-from tests.tutils import assert_swap_compare
+from cmpdisktree import comparer
+from cmpdisktree.utils import ERR_LOG_DEFAULT_NAME
+from tests.tutils import assert_swap_compare, compare_in, num_of_err_lines
 
 DATA_PATH = Path('larger')
 
@@ -40,3 +43,182 @@ class TestFSLargerStructureOnly:
         # AND a 'Directory does not exist in FS1' line, so in 2 lines.
         assert_swap_compare(False, DATA_PATH, 'one', 'two-2-dirs-diff', 3,
                             traversal_only=True)
+
+
+class TestFSLargerTraverseFromList:
+    def test_blank_and_top_lines(self, tmp_path):
+        travpath = tmp_path.joinpath('list.txt')
+        travpath.write_text('./tasks.py\n\n.\n./LICENSE\n')
+        assert_swap_compare(True, DATA_PATH, 'one', 'two',
+                            traverse_from_list=travpath)
+
+
+class TestFSLargerTraverseWorkers:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', traverse_workers=4)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            traverse_workers=4)
+
+    def test_same_log_as_single_thread(self):
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff', traversal_only=True)
+        single_log = Path(ERR_LOG_DEFAULT_NAME).read_text()
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff', traversal_only=True,
+                   traverse_workers=4)
+        assert Path(ERR_LOG_DEFAULT_NAME).read_text() == single_log
+
+
+class TestFSLargerPipeline:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', pipeline=True)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            pipeline=True)
+
+    def test_symlink_and_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-1-symlink-diff', 2,
+                            pipeline=True, traverse_workers=4)
+
+
+class TestFSLargerCompareWorkers:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', compare_workers=4)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            compare_workers=4)
+
+    def test_pipelined_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            compare_workers=4, pipeline=True)
+
+
+class TestFSLargerSpill:
+    def test_file_diff(self):
+        # A threshold of 1 MiB is not reached: run the spilling with a tiny one
+        with mock.patch.object(comparer, 'MIB', 100):
+            assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                                spill_threshold=1)
+
+
+class TestFSLargerDirFds:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', dir_fds=True)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            dir_fds=True)
+
+    def test_symlink_and_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-1-symlink-diff', 2,
+                            dir_fds=True, traverse_workers=4)
+
+    def test_same_log_as_paths(self):
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff')
+        path_log = Path(ERR_LOG_DEFAULT_NAME).read_text()
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff', dir_fds=True)
+        assert Path(ERR_LOG_DEFAULT_NAME).read_text() == path_log
+
+
+class TestFSLargerSplitScan:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', split_scan=True)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            split_scan=True, traverse_workers=2)
+
+    def test_same_log_as_lockstep(self):
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff')
+        lockstep_log = Path(ERR_LOG_DEFAULT_NAME).read_text()
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff', split_scan=True)
+        assert Path(ERR_LOG_DEFAULT_NAME).read_text() == lockstep_log
+        compare_in(DATA_PATH, 'one', 'two-1-symlink-diff', split_scan=True,
+                   dir_fds=True, traverse_workers=3)
+        assert Path(ERR_LOG_DEFAULT_NAME).read_text() == lockstep_log
+
+
+class TestFSLargerDeviceWorkers:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', fs1_device_workers=2)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            compare_workers=4, fs2_device_workers=1)
+
+
+class TestFSLargerReadOrder:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', read_order='inode')
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            read_order='extent')
+
+
+class TestFSLargerPrefetch:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', prefetch=4)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            compare_workers=3, prefetch=4)
+
+
+class TestFSLargerSmallFiles:
+    def test_same(self):
+        assert_swap_compare(True, DATA_PATH, 'one', 'two', compare_workers=3)
+
+    def test_file_diff(self):
+        assert_swap_compare(False, DATA_PATH, 'one', 'two-3-files-diff', 3,
+                            small_file_size=1)
+
+    def test_batch_boundaries(self, tmp_path):
+        num_files = 2 * comparer.COMPARE_BATCH_SIZE + 20
+        for fs in ['fs1', 'fs2']:
+            tmp_path.joinpath(fs).mkdir()
+            for i in range(num_files):
+                tmp_path.joinpath(fs, f'file-{i:03d}.txt').write_text(f'same {i:03d}')
+        # Same size, in the second batch
+        tmp_path.joinpath('fs2', 'file-100.txt').write_text('diff 100')
+
+        batch_sizes = []
+        next_compare_batch = comparer.Comparer.next_compare_batch
+
+        def recording_next_compare_batch(self, items, held):
+            batch = next_compare_batch(self, items, held)
+            batch_sizes.append(len(batch))
+            return batch
+
+        with mock.patch.object(
+            comparer.Comparer, 'next_compare_batch', recording_next_compare_batch
+        ):
+            assert not compare_in(tmp_path, 'fs1', 'fs2', compare_workers=3)
+        assert num_of_err_lines(1) == 1
+        assert max(batch_sizes) == comparer.COMPARE_BATCH_SIZE
+        assert sum(batch_sizes) >= num_files
+
+    def test_other_files_alone(self, tmp_path):
+        for fs in ['fs1', 'fs2']:
+            tmp_path.joinpath(fs).mkdir()
+            for i in range(100):
+                tmp_path.joinpath(fs, f'file-{i:03d}.txt').write_text(f'same {i:03d}')
+            # Sorted into the middle of the small files
+            tmp_path.joinpath(fs, 'file-050.bin').write_bytes(bytes(100000))
+
+        batches = []
+        next_compare_batch = comparer.Comparer.next_compare_batch
+
+        def recording_next_compare_batch(self, items, held):
+            batch = next_compare_batch(self, items, held)
+            batches.append([item.path1.name for item in batch])
+            return batch
+
+        with mock.patch.object(
+            comparer.Comparer, 'next_compare_batch', recording_next_compare_batch
+        ):
+            assert compare_in(tmp_path, 'fs1', 'fs2', compare_workers=3)
+        assert ['file-050.bin'] in batches
+        assert sum(map(len, batches)) >= 101
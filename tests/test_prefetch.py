@@ -0,0 +1,69 @@
+"""
+Test for the read-ahead of upcoming files in prefetch.py
+"""
+
+import stat
+import threading
+from pathlib import Path
+
+import pytest
+
+from cmpdisktree import prefetch
+from cmpdisktree.filecompare import CompareItem
+
+
+def file_item(i, size=100):
+    sig = (stat.S_IFREG, size, 0.0)
+    return CompareItem(Path(f'fs1/file-{i}'), Path(f'fs2/file-{i}'), sig, sig)
+
+
+@pytest.fixture()
+def prefetched(monkeypatch):
+    """The paths passed to prefetch_file"""
+    paths = []
+    lock = threading.Lock()
+
+    def record(path, length):
+        with lock:
+            paths.append(path)
+
+    monkeypatch.setattr(prefetch, 'prefetch_file', record)
+    return paths
+
+
+class TestPrefetcher:
+    @pytest.mark.parametrize('depth', [1, 3, 100])
+    def test_same_order(self, prefetched, depth):
+        items = [file_item(i) for i in range(20)]
+        assert list(prefetch.Prefetcher(items, depth)) == items
+
+    def test_only_files_with_content(self, prefetched):
+        dir_sig = (stat.S_IFDIR, 0, 0.0)
+        items = [
+            file_item(0),
+            CompareItem(Path('fs1/dir'), Path('fs2/dir'), dir_sig, dir_sig),
+            file_item(1, size=0),
+            CompareItem(Path('fs1/x'), Path('fs2/x'), (stat.S_IFREG, 1, 0.0), None),
+        ]
+        # Depth larger than the items: nothing is handed out before all are queued
+        fetcher = prefetch.Prefetcher(items, 10)
+        it = iter(fetcher)
+        next(it)
+        fetcher_paths = set(map(str, prefetched))
+        assert fetcher_paths <= {'fs1/file-0', 'fs2/file-0', 'fs1/x', 'fs2/x'}
+        assert 'fs1/dir' not in fetcher_paths
+        assert list(it) == items[1:]
+
+    def test_stop_early(self, prefetched):
+        items = [file_item(i) for i in range(1000)]
+        it = iter(prefetch.Prefetcher(items, 5))
+        assert next(it) == items[0]
+        it.close()
+        assert len(prefetched) < 2 * len(items)
+
+    def test_prefetch_file(self, tmp_path):
+        path = tmp_path.joinpath('file')
+        path.write_bytes(b'x' * 10000)
+        prefetch.prefetch_file(path, 4096)
+        # Not existing: ignored
+        prefetch.prefetch_file(tmp_path.joinpath('nope'), 4096)
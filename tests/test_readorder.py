@@ -0,0 +1,47 @@
+"""
+Test for the read order keys in readorder.py
+"""
+
+import os
+
+from cmpdisktree import readorder
+
+
+def write_synced(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class TestReadOrder:
+    def test_inode_number(self, tmp_path):
+        path = tmp_path.joinpath('file')
+        path.write_bytes(b'x')
+        assert readorder.inode_number(path) == path.stat().st_ino
+        assert readorder.inode_number(path, 42) == 42
+        assert readorder.inode_number(tmp_path.joinpath('nope')) == 0
+
+    def test_physical_offset(self, tmp_path):
+        empty = tmp_path.joinpath('empty')
+        empty.write_bytes(b'')
+        assert readorder.physical_offset(empty) is None
+        assert readorder.physical_offset(tmp_path.joinpath('nope')) is None
+
+        path = tmp_path.joinpath('file')
+        write_synced(path, os.urandom(100000))
+        # None on filesystems without the query
+        offset = readorder.physical_offset(path)
+        assert offset is None or offset > 0
+
+    def test_unknown_offsets_last(self, tmp_path):
+        empty = tmp_path.joinpath('empty')
+        empty.write_bytes(b'')
+        path = tmp_path.joinpath('file')
+        write_synced(path, os.urandom(100000))
+
+        key_empty = readorder.order_key(readorder.EXTENT, empty)
+        key_file = readorder.order_key(readorder.EXTENT, path)
+        assert key_empty[0]
+        if not key_file[0]:
+            assert key_file < key_empty
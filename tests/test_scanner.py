@@ -0,0 +1,119 @@
+"""
+Test for the directory listing engine in scanner.py
+"""
+
+import os
+from types import SimpleNamespace
+
+from cmpdisktree import scanner
+
+
+def names(entries):
+    return sorted(e.name for e in entries)
+
+
+class TestScanDir:
+    def test_split_like_oswalk(self, tmp_path):
+        tmp_path.joinpath('dir').mkdir()
+        tmp_path.joinpath('file.txt').write_text('content')
+        tmp_path.joinpath('dir-link').symlink_to('dir')
+        tmp_path.joinpath('file-link').symlink_to('file.txt')
+        tmp_path.joinpath('broken-link').symlink_to('does-not-exist')
+
+        listing = scanner.scan_dir(tmp_path)
+        assert names(listing.dirs) == ['dir', 'dir-link']
+        assert names(listing.files) == ['broken-link', 'file-link', 'file.txt']
+
+    def test_nonexisting_calls_onerror(self, tmp_path):
+        errors = []
+        listing = scanner.scan_dir(tmp_path.joinpath('nope'), onerror=errors.append)
+        assert listing is None
+        assert len(errors) == 1
+        assert isinstance(errors[0], FileNotFoundError)
+
+
+class TestScanDirAt:
+    def test_relative_to_fd(self, tmp_path):
+        tmp_path.joinpath('dir', 'sub').mkdir(parents=True)
+        tmp_path.joinpath('dir', 'file.txt').write_text('content')
+        tmp_path.joinpath('dir', 'link').symlink_to('file.txt')
+
+        top_fd, _ = scanner.scan_dir_at(tmp_path)
+        try:
+            fd, listing = scanner.scan_dir_at('dir', dir_fd=top_fd)
+        finally:
+            os.close(top_fd)
+        try:
+            assert names(listing.dirs) == ['sub']
+            assert names(listing.files) == ['file.txt', 'link']
+            # The entries work relative to the still open directory
+            link = [e for e in listing.files if e.name == 'link'][0]
+            assert link.is_symlink()
+            assert os.readlink(link.path, dir_fd=fd) == 'file.txt'
+            assert scanner.exists('link', dir_fd=fd)
+            assert not scanner.exists('nope', dir_fd=fd)
+        finally:
+            os.close(fd)
+
+    def test_nonexisting_calls_onerror(self, tmp_path):
+        errors = []
+        result = scanner.scan_dir_at(tmp_path.joinpath('nope'), onerror=errors.append)
+        assert result == (None, None)
+        assert isinstance(errors[0], FileNotFoundError)
+
+
+class TestTreeVolume:
+    def test_tree(self, tmp_path):
+        tmp_path.joinpath('dir', 'sub').mkdir(parents=True)
+        tmp_path.joinpath('dir', 'a.txt').write_text('12345')
+        tmp_path.joinpath('dir', 'sub', 'b.txt').write_text('123')
+        tmp_path.joinpath('dir', 'link').symlink_to('sub')
+
+        volume = scanner.tree_volume(tmp_path.joinpath('dir'))
+        assert (volume.entries, volume.dirs) == (5, 2)
+        assert volume.bytes == 5 + 3 + len('sub')
+
+        volume = scanner.tree_volume(tmp_path.joinpath('dir'), children_only=True)
+        assert (volume.entries, volume.dirs) == (4, 1)
+
+    def test_file_and_nonexisting(self, tmp_path):
+        tmp_path.joinpath('a.txt').write_text('12345')
+        assert scanner.tree_volume(tmp_path.joinpath('a.txt')) == (1, 0, 5)
+        assert scanner.tree_volume(tmp_path.joinpath('nope')) == (0, 0, 0)
+
+    def test_stays_on_device(self, tmp_path, monkeypatch):
+        tmp_path.joinpath('dir', 'mnt', 'sub').mkdir(parents=True)
+        tmp_path.joinpath('dir', 'mnt', 'a.txt').write_text('12345')
+        tmp_path.joinpath('dir', 'b.txt').write_text('123')
+        mount_point = str(tmp_path.joinpath('dir', 'mnt'))
+        lstat = os.lstat
+
+        def other_device_lstat(path):
+            st = lstat(path)
+            if os.fspath(path) == mount_point:
+                return SimpleNamespace(st_dev=st.st_dev + 1, st_mode=st.st_mode)
+            return st
+
+        monkeypatch.setattr(scanner.os, 'lstat', other_device_lstat)
+        # mnt itself is counted, but nothing below it
+        volume = scanner.tree_volume(tmp_path.joinpath('dir'))
+        assert volume == (3, 2, 3)
+
+
+class TestJoinEntries:
+    def test_buckets(self):
+        entries1 = [SimpleNamespace(name=n) for n in ['c', 'a', 'b', 'x']]
+        entries2 = [SimpleNamespace(name=n) for n in ['b', 'y', 'a', 'z']]
+
+        joined = scanner.join_entries(entries1, entries2)
+        assert [e.name for e in joined.only1] == ['c', 'x']
+        assert [e.name for e in joined.only2] == ['y', 'z']
+        assert [(e1.name, e2.name) for e1, e2 in joined.both] == [
+            ('a', 'a'),
+            ('b', 'b'),
+        ]
+
+    def test_empty(self):
+        entries = [SimpleNamespace(name='a')]
+        assert scanner.join_entries(entries, []).only1 == entries
+        assert scanner.join_entries([], entries).only2 == entries